@@ -1,197 +1,140 @@
-import os
 import streamlit as st
+import json
 from datetime import datetime, timedelta
 import pandas as pd
-import xmlrpc.client
-import re
-from collections import defaultdict
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# === Config ===
-CONFIG = {
-    'url': os.getenv('ODOO_URL'),
-    'db': os.getenv('ODOO_DB'),
-    'username': os.getenv('ODOO_USERNAME'),
-    'password': os.getenv('ODOO_PASSWORD'),
-    'hq_company_name': os.getenv('HQ_COMPANY_NAME'),
-    'app_username': os.getenv('APP_USERNAME'),
-    'app_password': os.getenv('APP_PASSWORD'),
-}
-
-# === Vendor Names to Exclude ===
-EXCLUDED_PARTNER_NAMES = [
-    "Wedtree eStore Private Limited - HO",
-    "Wedtree eStore Private Limited - Coimbatore",
-    "Wedtree eStore Private Limited - T Nagar",
-    "Wedtree eStore Private Limited - Online",
-    "Wedtree eStore Private Limited - Vizag",
-    "Saree Trails",
-    "Wedtree eStore Private Limited - Malleshwaram",
-    "Wedtree eStore Private Limited - Jayanagar",
-    "Wedtree eStore Private Limited - Hyderabad"
-]
+import engine
+from config import CONFIG
+from engine import resolve_product_ids
+from jobs import JobManager
+from lot_files import read_lot_numbers
+from rpc_trace import recent_traces, trace_operation
 
 # === Helper Functions ===
-def extract_sku_from_product_name(product_name):
-    if not product_name:
-        return "N/A"
-    match = re.search(r'([A-Za-z0-9\-]+)$', product_name.strip())
-    return match.group(1) if match else "N/A"
+@st.cache_resource(show_spinner=False)
+def get_odoo_client():
+    """Authenticate once per process and share one pooled client across sessions"""
+    return engine.create_odoo_client()
 
 def connect_odoo():
     try:
-        common = xmlrpc.client.ServerProxy(CONFIG['url'] + 'xmlrpc/2/common')
-        uid = common.authenticate(CONFIG['db'], CONFIG['username'], CONFIG['password'], {})
-        models = xmlrpc.client.ServerProxy(CONFIG['url'] + 'xmlrpc/2/object')
-        return uid, models
+        client = get_odoo_client()
+        return client.uid, client
     except Exception as e:
         st.error(f"Failed to connect to Odoo: {str(e)}")
         return None, None
 
-def get_hq_company_id(models):
+def get_company_ids(client):
     try:
-        hq_company_id = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'res.company', 'search',
-            [[['name', '=', CONFIG['hq_company_name']]]])[0]
-        return hq_company_id
-    except:
-        st.error(f"Failed to find company: {CONFIG['hq_company_name']}")
+        return engine.get_company_ids(client)
+    except Exception as e:
+        st.error(str(e))
         return None
 
-def lookup_lot_numbers(lot_numbers, models, hq_company_id):
+def create_vendor_credit(client, vendor_name, credit_note_date, due_date, reference, line_vals, company_id):
     try:
-        move_lines = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'stock.move.line', 'search_read',
-            [[
-                ['lot_name', 'in', lot_numbers],
-                ['company_id', '=', hq_company_id]
-            ]],
-            {'fields': ['lot_name', 'picking_id', 'product_id']})
-
-        if not move_lines:
-            st.warning("No stock move lines found for the given lot numbers.")
-            return None
-
-        # Map Picking IDs and Product IDs
-        picking_ids = list(set(ml['picking_id'][0] for ml in move_lines if ml['picking_id']))
-        product_ids = list(set(ml['product_id'][0] for ml in move_lines if ml['product_id']))
-
-        # Fetch Picking Details
-        pickings = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'stock.picking', 'read',
-            [picking_ids],
-            {'fields': ['id', 'name', 'origin', 'partner_id']})
-        picking_map = {p['id']: p for p in pickings}
-
-        # Filter Pickings (Remove excluded vendors)
-        filtered_picking_ids = [
-            p['id'] for p in pickings
-            if p['partner_id'] and p['partner_id'][1] not in EXCLUDED_PARTNER_NAMES
-        ]
+        return engine.create_vendor_credit_note(
+            client, vendor_name, credit_note_date, due_date, reference, line_vals, company_id)
+    except Exception as e:
+        st.error(str(e))
+        return None
+
+# === Background Jobs ===
+@st.cache_resource(show_spinner=False)
+def get_job_manager():
+    """Process-wide job runner, so jobs survive reruns and page reloads"""
+    return JobManager(max_workers=CONFIG['job_workers'])
+
+def run_lookup_job(job, lot_numbers, client, company_id, previous=None, summary=False):
+    progress = lambda done, total: job.set_progress(done, total, f"Looked up lot chunk {done}/{total}")
+    with trace_operation(f"{'Summary lookup' if summary else 'Lookup'} of {len(lot_numbers)} lots"):
+        if summary:
+            result = engine.summarize_lot_numbers(lot_numbers, client, company_id, progress=progress, warn=job.warn)
+            return result, {'reused': 0, 'dropped': 0, 'looked_up': len(set(lot_numbers))}
+        return engine.update_lookup(previous, lot_numbers, client, company_id, progress=progress, warn=job.warn)
+
+def run_bulk_job(job, run_key, run_params, lot_numbers, client, company_ids, credit_note_date, due_date, reference,
+                 start_fresh=False):
+    journal = engine.get_checkpoint_journal()
+    # A second run of the same key would create every credit note twice
+    with journal.lock_run(run_key), trace_operation(f"Bulk run of {len(lot_numbers)} lots"):
+        if start_fresh:
+            journal.discard(run_key)
+        grouped_data, product_ids, resumed = engine.plan_bulk_run(
+            run_key, run_params, lot_numbers, client, company_ids,
+            progress=lambda done, total: job.set_progress(done, total, f"Looked up lot chunk {done}/{total}"),
+            warn=job.warn)
+        if not grouped_data:
+            return grouped_data
 
-        # Fetch Product Names
-        products = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'product.product', 'read',
-            [product_ids],
-            {'fields': ['id', 'name']})
-        product_map = {p['id']: p['name'] for p in products}
-
-        # Grouping data
-        grouped_data = defaultdict(lambda: {'lots': set(), 'unit_price': 0.0, 'discount': 0.0})
-
-        for ml in move_lines:
-            picking_id = ml['picking_id'][0] if ml['picking_id'] else None
-            product_id = ml['product_id'][0] if ml['product_id'] else None
-
-            if not picking_id or picking_id not in filtered_picking_ids:
-                continue
-
-            picking = picking_map[picking_id]
-            product_name = product_map.get(product_id, 'N/A')
-            sku = extract_sku_from_product_name(product_name)
-            po_name = picking['origin']
-            vendor_name = picking['partner_id'][1] if picking['partner_id'] else "Unknown Vendor"
-
-            # Get Purchase Order ID
-            po_ids = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-                'purchase.order', 'search',
-                [[['name', '=', po_name]]],
-                {'limit': 1})
-            if not po_ids:
-                st.warning(f"PO '{po_name}' not found for picking {picking['name']}")
-                continue
-            po_id = po_ids[0]
-
-            # Get PO Line Items
-            pol_ids = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-                'purchase.order.line', 'search',
-                [[['order_id', '=', po_id]]])
-            lines = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-                'purchase.order.line', 'read',
-                [pol_ids],
-                {'fields': ['product_template_id', 'price_unit', 'discount']})
-
-            matched = False
-            for line in lines:
-                line_product = line['product_template_id'][1] if line['product_template_id'] else ''
-                if sku in line_product or product_name.lower() in line_product.lower():
-                    key = (po_name, line_product, vendor_name)
-                    grouped_data[key]['lots'].add(ml['lot_name'])
-                    grouped_data[key]['unit_price'] = line['price_unit']
-                    grouped_data[key]['discount'] = line['discount']
-                    matched = True
-                    break
-
-            if not matched:
-                st.warning(f"No matching PO line found for product '{product_name}' (Lot: {ml['lot_name']})")
+        # Vendors finished by an earlier attempt of the same run are not created again
+        for result in journal.completed_results(run_key):
+            job.add_partial_result(dict(result, credit_note_date=credit_note_date, reference=reference, resumed=True))
+        if resumed:
+            job.warn(f"Resumed an earlier run of this file: {len(job.partial_results)} vendor(s) already had a credit note.")
 
+        vendor_count = len(set((group.company_id, group.vendor) for group in grouped_data))
+        job.set_progress(len(job.partial_results), vendor_count, f"Creating credit notes for {vendor_count} vendors")
+        results = engine.run_bulk_credits(
+            run_key, client, grouped_data, product_ids, credit_note_date, due_date, reference)
+        for result in results:
+            job.add_partial_result(dict(result, credit_note_date=credit_note_date, reference=reference))
+            done = len(job.partial_results)
+            job.set_progress(done, vendor_count, f"Processed {done}/{vendor_count} vendors")
         return grouped_data
 
-    except Exception as e:
-        st.error(f"Error during lot number lookup: {str(e)}")
-        return None
+def start_job(query_param, kind, func, *args):
+    """Submit a background job and track its ID in the URL so a reload reattaches to it"""
+    job = get_job_manager().submit(kind, func, *args)
+    st.query_params[query_param] = job.id
+    return job
 
-def create_vendor_credit(models, vendor_name, credit_note_date, due_date, reference, line_vals, company_id):
-    try:
-        # Fetch Vendor (Partner) ID
-        vendor_ids = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'res.partner', 'search',
-            [[['name', '=', vendor_name], '|', ['company_id', '=', company_id], ['company_id', '=', False]]],
-            {'limit': 1})
-        if not vendor_ids:
-            st.error(f"Vendor '{vendor_name}' not found in company '{CONFIG['hq_company_name']}'.")
-            return None
-
-        # Fetch Journal ID (Vendor Bills / Purchase type)
-        journal_ids = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'account.journal', 'search',
-            [[['type', '=', 'purchase'], ['name', 'ilike', 'Vendor Bills'], ['company_id', '=', company_id]]],
-            {'limit': 1})
-        if not journal_ids:
-            st.error("'Vendor Bills' journal not found for specified company.")
-            return None
-
-        # Create Vendor Credit Note
-        credit_note_id = models.execute_kw(CONFIG['db'], st.session_state.uid, CONFIG['password'],
-            'account.move', 'create',
-            [{
-                'move_type': 'in_refund',
-                'partner_id': vendor_ids[0],
-                'invoice_date': credit_note_date,
-                'invoice_date_due': due_date,
-                'journal_id': journal_ids[0],
-                'ref': reference,
-                'invoice_line_ids': line_vals,
-                'company_id': company_id,
-            }]
-        )
-        return credit_note_id
-    except Exception as e:
-        st.error(f"Error creating credit note: {str(e)}")
-        return None
+def attach_job(query_param):
+    job_id = st.query_params.get(query_param)
+    return get_job_manager().get(job_id) if job_id else None
+
+def render_job_warnings(state):
+    if state['warnings']:
+        with st.expander(f"⚠️ {len(state['warnings'])} warnings", expanded=False):
+            for message in state['warnings']:
+                st.warning(message)
+
+def render_vendor_result(result):
+    vendor_name = result['vendor']
+    st.markdown(f"### Processing vendor: {vendor_name} ({engine.get_company_name(result['company_id'])})")
+
+    if result['credit_note_id']:
+        st.markdown(f"""
+        <div class="success-box">
+            <h3 style="margin: 0 0 15px 0;">✅ {'Credit Note Created Earlier (resumed run)' if result.get('resumed') else 'Credit Note Created Successfully!'}</h3>
+            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 15px;">
+                <div><strong>🆔 Credit Note ID:</strong> {result['credit_note_id']}</div>
+                <div><strong>🏪 Vendor:</strong> {vendor_name}</div>
+                <div><strong>🏢 Company:</strong> {engine.get_company_name(result['company_id'])}</div>
+                <div><strong>📅 Date:</strong> {result['credit_note_date']}</div>
+                <div><strong>📝 Reference:</strong> {result['reference']}</div>
+            </div>
+            <div style="margin-top: 15px; text-align: center;">
+                <strong>📦 Total Products:</strong> {result['line_count']}
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        st.error(f"❌ {result['error']}")
+
+@st.fragment(run_every=1.0)
+def render_job_progress(job_id, show_partial_results=False):
+    """Poll a running job; triggers a full rerun once it has finished"""
+    job = get_job_manager().get(job_id)
+    if not job or job.finished:
+        st.rerun()
+        return
+
+    state = job.snapshot()
+    done, total = state['progress']
+    st.progress(done / total if total else 0.0, text=f"🔄 {state['message'] or 'Starting...'}")
+    if show_partial_results:
+        for result in state['partial_results']:
+            render_vendor_result(result)
 
 def check_login(username, password):
     """Check if login credentials match environment variables"""
@@ -230,10 +173,11 @@ def render_login_sidebar():
             
             
             if st.button("🚪 Logout", key="logout_button", use_container_width=True):
-                for key in ['authenticated', 'username', 'uid', 'models', 'grouped_data', 
-                           'selected_vendor', 'selected_products']:
+                for key in ['authenticated', 'username', 'uid', 'client', 'grouped_data', 'selected_company',
+                           'selected_vendor', 'selected_products', 'bulk_lot_file', 'applied_lookup_job']:
                     if key in st.session_state:
                         del st.session_state[key]
+                st.query_params.clear()
                 st.rerun()
 
 def render_connection_status():
@@ -259,13 +203,208 @@ def render_connection_status():
         with col2:
             if st.button("🔗 Connect to Odoo", key="connect_odoo_button", use_container_width=True, type="primary"):
                 with st.spinner("🔄 Connecting to Odoo..."):
-                    st.session_state.uid, st.session_state.models = connect_odoo()
+                    st.session_state.uid, st.session_state.client = connect_odoo()
                     if st.session_state.uid:
                         st.success("✅ Successfully connected to Odoo!")
                         st.rerun()
                     else:
                         st.error("❌ Failed to connect to Odoo. Please check your credentials.")
 
+def render_master_data_sidebar():
+    """Render master data cache statistics and refresh action in sidebar"""
+    master_data = engine.get_master_data_cache()
+    with st.sidebar:
+        st.markdown("---")
+        st.markdown("**🗂️ Master Data Cache**")
+        stats = master_data.stats()
+        price_cache = engine.get_price_cache()
+        if price_cache:
+            stats['po_price'] = price_cache.stats()
+        if stats:
+            st.dataframe(
+                pd.DataFrame.from_dict(stats, orient='index')[['hits', 'misses', 'size']],
+                use_container_width=True
+            )
+        if st.button("🔄 Refresh Master Data", key="refresh_master_data_button", use_container_width=True):
+            engine.clear_caches()
+            st.success("✅ Master data will be reloaded from Odoo")
+        
+        lot_index = engine.get_lot_index()
+        if lot_index:
+            stats = lot_index.stats()
+            watermarks = [state['watermark'] for state in stats['companies'].values() if state['watermark']]
+            st.caption(f"📇 Lot index: {stats['lots']:,} lots, synced to {max(watermarks) if watermarks else 'never'}")
+
+# === Lookup Results Table ===
+RESULTS_PAGE_SIZES = [25, 50, 100, 250]
+RESULTS_SORT_COLUMNS = ['PO', 'Product', 'Lots', 'Unit Price', 'Discount %', 'Line Total']
+
+def build_results_frame(groups):
+    """One row per (PO, product) group without the lot lists; 'group' indexes into ``groups``"""
+    frame = pd.DataFrame({
+        'PO': [group.po_name for group in groups],
+        'Product': [group.product_name for group in groups],
+        'Lots': [group.lot_count for group in groups],
+        'Unit Price': [group.unit_price for group in groups],
+        'Discount %': [group.discount for group in groups],
+    })
+    frame['Line Total'] = frame['Lots'] * frame['Unit Price'] * (1 - frame['Discount %'] / 100)
+    frame['group'] = range(len(groups))
+    return frame
+
+def get_selected_groups():
+    """Lookup groups added to the credit note; the selection only holds their keys"""
+    grouped_data = st.session_state.grouped_data
+    if not grouped_data:
+        return []
+    return [grouped_data.get(key) for key in st.session_state.selected_products if key in grouped_data]
+
+def load_lots(groups):
+    """Fetch the lot names of summary groups into the session's lookup result; returns the loaded groups"""
+    if all(group.loaded for group in groups):
+        return groups
+    with st.spinner("🏷️ Loading lot numbers..."), trace_operation(f"Lot numbers of {len(groups)} groups"):
+        st.session_state.grouped_data = engine.load_group_lots(
+            st.session_state.client, st.session_state.grouped_data, groups)
+    return [st.session_state.grouped_data.get(group.key) for group in groups]
+
+def add_selected_products(groups):
+    """Add lookup groups to the credit note, skipping ones already added; returns the number added"""
+    groups = load_lots(groups)
+    existing = set(st.session_state.selected_products)
+    added = 0
+    for group in groups:
+        if group.key in existing:
+            continue
+        st.session_state.selected_products.append(group.key)
+        existing.add(group.key)
+        added += 1
+    return added
+
+def prune_selected_products(grouped_data):
+    """Drop groups that are no longer in the lookup result from the credit note selection"""
+    st.session_state.selected_products = [
+        key for key in st.session_state.selected_products if grouped_data and key in grouped_data
+    ]
+
+def render_results_table(groups):
+    """Render one vendor's lookup groups as a filtered, sorted and paginated table with multi-row selection.
+
+    Only the current page is sent to the browser and lot numbers are listed
+    on demand for the selected rows, so render time does not grow with the
+    number of groups.
+    """
+    frame = build_results_frame(groups)
+    added_keys = set(st.session_state.selected_products)
+    frame.insert(0, 'Added', [group.key in added_keys for group in groups])
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        search = st.text_input("🔎 Filter by PO or product:", key="results_filter").strip()
+    with col2:
+        sort_column = st.selectbox("Sort by:", RESULTS_SORT_COLUMNS, key="results_sort")
+    with col3:
+        page_size = st.selectbox("Rows:", RESULTS_PAGE_SIZES, key="results_page_size")
+    with col4:
+        descending = st.toggle("Descending", key="results_descending")
+
+    if search:
+        frame = frame[
+            frame['PO'].str.contains(search, case=False, regex=False) |
+            frame['Product'].str.contains(search, case=False, regex=False)
+        ]
+    frame = frame.sort_values(sort_column, ascending=not descending, kind='stable')
+
+    page_count = max(1, -(-len(frame) // page_size))
+    if st.session_state.get('results_page', 1) > page_count:
+        st.session_state.results_page = page_count
+    page = st.number_input(f"Page (of {page_count}):", min_value=1, max_value=page_count, step=1, key="results_page")
+    page_frame = frame.iloc[(page - 1) * page_size:page * page_size]
+
+    # A new key per view resets the selection when the page, sort or filter changes
+    event = st.dataframe(
+        page_frame.drop(columns='group'),
+        on_select='rerun',
+        selection_mode='multi-row',
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Added': st.column_config.CheckboxColumn("In Credit Note", width='small'),
+            'Unit Price': st.column_config.NumberColumn(format="₹%.2f"),
+            'Discount %': st.column_config.NumberColumn(format="%.1f%%"),
+            'Line Total': st.column_config.NumberColumn(format="₹%.2f"),
+        },
+        key=f"results_table_{st.session_state.selected_vendor}_{search}_{sort_column}_{descending}_{page_size}_{page}"
+    )
+    selected_groups = [groups[index] for index in page_frame['group'].iloc[event.selection.rows]]
+
+    first_row = (page - 1) * page_size + 1 if len(frame) else 0
+    st.caption(f"Showing {first_row}-{min(page * page_size, len(frame))} of {len(frame)} groups · "
+               f"{len(selected_groups)} selected")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"➕ Add Selected to Credit Note ({len(selected_groups)})", key="add_selected_button",
+                     use_container_width=True, disabled=not selected_groups):
+            added = add_selected_products(selected_groups)
+            if added:
+                st.success(f"✅ Added {added} product(s) to credit note!")
+                st.rerun()
+            else:
+                st.warning("⚠️ Selected products are already in the credit note list!")
+    with col2:
+        show_lots = st.toggle("🏷️ Show lot numbers of selected rows", key="results_show_lots", disabled=not selected_groups)
+
+    if show_lots and selected_groups:
+        selected_groups = load_lots(selected_groups)
+        st.dataframe(
+            pd.DataFrame(
+                [(group.po_name, group.product_name, lot) for group in selected_groups for lot in group.lots],
+                columns=['PO', 'Product', 'Lot Number']
+            ),
+            use_container_width=True,
+            hide_index=True
+        )
+
+def render_diagnostics_panel():
+    """Render RPC traces of recent operations with per-call aggregates and N+1 flags"""
+    traces = recent_traces()
+    with st.expander("🩺 RPC Diagnostics", expanded=False):
+        if not traces:
+            st.info("No traced operations yet. Run a lookup or create a credit note.")
+            return
+
+        labels = [f"{trace.started_at} · {trace.name}" for trace in traces]
+        selected = st.selectbox("Operation", range(len(traces)), format_func=lambda i: labels[i], key="diagnostics_trace")
+        summary = traces[selected].summary()
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Wall Time", f"{summary['wall_time_s'] or 0:.2f}s")
+        col2.metric("RPC Calls", summary['rpc_calls'])
+        col3.metric("RPC Time", f"{summary['rpc_time_ms'] / 1000:.2f}s")
+        col4.metric("Payload", f"{(summary['bytes_sent'] + summary['bytes_received']) / 1024:,.0f} KB")
+
+        for flag in summary['flags']:
+            st.warning(flag)
+
+        if summary['operations']:
+            st.dataframe(
+                pd.DataFrame(summary['operations'])[
+                    ['model', 'method', 'calls', 'errors', 'total_ms', 'avg_ms', 'max_ms',
+                     'arg_size', 'results', 'bytes_sent', 'bytes_received']
+                ].round(1),
+                use_container_width=True,
+                hide_index=True
+            )
+
+        st.download_button(
+            "📥 Download trace (JSON)",
+            data=json.dumps(summary, indent=2, default=str),
+            file_name=f"rpc_trace_{summary['started_at'].replace(':', '')}.json",
+            mime="application/json",
+            key="diagnostics_download"
+        )
+
 # === Streamlit App ===
 def main():
     st.set_page_config(
@@ -280,8 +419,9 @@ def main():
         'authenticated': False,
         'username': None,
         'uid': None,
-        'models': None,
+        'client': None,
         'grouped_data': None,
+        'selected_company': None,
         'selected_vendor': None,
         'selected_products': []
     }
@@ -476,8 +616,10 @@ def main():
     render_connection_status()
     
     if st.session_state.uid:
-        # Get HQ Company ID
-        hq_company_id = get_hq_company_id(st.session_state.models)
+        render_master_data_sidebar()
+
+        # Companies searched by lookups: COMPANY_NAMES, or the HQ company only
+        company_ids = list(get_company_ids(st.session_state.client) or {})
         
         # Main Tabs
         tab1, tab2 = st.tabs(["📊 Bulk Credit Note Creation", "📝 Manual Credit Note Creation"])
@@ -490,25 +632,29 @@ def main():
             <div style="background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%); 
                        padding: 25px; border-radius: 15px; margin: 20px 0; text-align: center;">
                 <h3 style="color: #2c3e50; margin-bottom: 15px;">📁 Upload Excel File</h3>
-                <p style="color: #34495e; margin-bottom: 0;">Upload your Excel file with lot numbers in Column A</p>
+                <p style="color: #34495e; margin-bottom: 0;">Upload your Excel or CSV file with lot numbers in Column A</p>
             </div>
             """, unsafe_allow_html=True)
             
             uploaded_file = st.file_uploader(
                 "Choose Excel file", 
-                type=["xlsx", "xls"], 
-                help="Excel file should contain lot numbers in the first column (Column A)",
+                type=["xlsx", "xls", "csv"], 
+                help="Excel or CSV file should contain lot numbers in the first column (Column A)",
                 key="bulk_upload_file"
             )
             
             if uploaded_file:
                 try:
-                    df = pd.read_excel(uploaded_file)
-                    if df.empty:
+                    # Parse once per upload; reruns reuse the parsed lot numbers
+                    cached_file = st.session_state.get('bulk_lot_file')
+                    if not cached_file or cached_file[0] != uploaded_file.file_id:
+                        cached_file = (uploaded_file.file_id, *read_lot_numbers(uploaded_file, uploaded_file.name))
+                        st.session_state.bulk_lot_file = cached_file
+                    _, lot_numbers, file_report = cached_file
+                    
+                    if not lot_numbers:
                         st.warning("⚠️ The uploaded file is empty.")
                     else:
-                        lot_numbers = df.iloc[:, 0].astype(str).str.strip().str.upper().tolist()
-                        
                         col1, col2, col3 = st.columns(3)
                         with col1:
                             st.markdown(f"""
@@ -517,6 +663,31 @@ def main():
                                 <h2 style="margin: 10px 0 0 0;">{len(lot_numbers)}</h2>
                             </div>
                             """, unsafe_allow_html=True)
+                        with col2:
+                            st.markdown(f"""
+                            <div class="metric-card">
+                                <h3 style="margin: 0;">🔁 Duplicate Rows</h3>
+                                <h2 style="margin: 10px 0 0 0;">{file_report['duplicate_rows']}</h2>
+                            </div>
+                            """, unsafe_allow_html=True)
+                        with col3:
+                            st.markdown(f"""
+                            <div class="metric-card">
+                                <h3 style="margin: 0;">⬜ Blank Rows</h3>
+                                <h2 style="margin: 10px 0 0 0;">{file_report['blank_rows']}</h2>
+                            </div>
+                            """, unsafe_allow_html=True)
+                        
+                        if file_report['duplicates']:
+                            with st.expander(f"🔁 {len(file_report['duplicates'])} lot numbers appear more than once", expanded=False):
+                                st.dataframe(
+                                    pd.DataFrame(
+                                        sorted(file_report['duplicates'].items()),
+                                        columns=['Lot Number', 'Extra Occurrences']
+                                    ),
+                                    use_container_width=True,
+                                    hide_index=True
+                                )
                         
                         # Credit Note Details
                         st.markdown('<h3 style="color: #2c3e50; margin-top: 30px;">📅 Credit Note Details</h3>', unsafe_allow_html=True)
@@ -532,73 +703,66 @@ def main():
                         
                         reference = st.text_input("📝 Reference/Reason:", value="Damage", help="Enter the reason for the credit note", key="bulk_reference")
                         
+                        # Same file and parameters resume the checkpointed run instead of starting over
+                        run_key, run_params = engine.bulk_run_key(
+                            [uploaded_file.getvalue()],
+                            credit_note_date.strftime('%Y-%m-%d'),
+                            due_date.strftime('%Y-%m-%d'),
+                            reference,
+                            company_ids
+                        )
+                        checkpoint = engine.get_checkpoint_journal().load(run_key)
+                        start_fresh = False
+                        if checkpoint:
+                            done_count = sum(1 for result in checkpoint['vendors'].values() if result['credit_note_id'])
+                            vendor_count = len(set((group['company_id'], group['vendor']) for group in checkpoint['groups']))
+                            st.info(f"♻️ This file was already processed on {checkpoint['created_at']}: "
+                                    f"{done_count}/{vendor_count} vendors have a credit note. "
+                                    f"Processing again only creates the missing ones; vendors whose creation timed out "
+                                    f"are checked in Odoo first so they are not created twice.")
+                            start_fresh = st.checkbox("Ignore the previous run and start fresh", key="bulk_start_fresh")
+                        
+                        # Starting another job would replace the running one in the URL and race it in Odoo
+                        current_job = attach_job('bulk_job')
+                        bulk_running = engine.get_checkpoint_journal().is_running(run_key) or (current_job and not current_job.finished)
+                        if bulk_running:
+                            st.info("⏳ A bulk run is in progress. Wait for it to finish before processing again.")
+                        
                         col1, col2, col3 = st.columns([1, 2, 1])
                         with col2:
-                            if st.button("🚀 Process & Create Credit Note", key="bulk_process_button", use_container_width=True, type="primary"):
-                                with st.spinner("🔄 Processing lot numbers and creating credit note..."):
-                                    # Process the lot numbers (existing logic)
-                                    grouped_data = lookup_lot_numbers(lot_numbers, st.session_state.models, hq_company_id)
-                                    
-                                    if grouped_data:
-                                        vendors = list(set([key[2] for key in grouped_data.keys()]))
-                                        
-                                        for vendor_name in vendors:
-                                            st.markdown(f"### Processing vendor: {vendor_name}")
-                                            vendor_data = {k: v for k, v in grouped_data.items() if k[2] == vendor_name}
-                                            
-                                            # Create line values for this vendor
-                                            line_vals = []
-                                            for (po_name, product_name, _), data in vendor_data.items():
-                                                if len(data['lots']) == 0:
-                                                    continue
-                                                
-                                                product_ids = st.session_state.models.execute_kw(
-                                                    CONFIG['db'], st.session_state.uid, CONFIG['password'],
-                                                    'product.product', 'search',
-                                                    [[['name', 'ilike', product_name], '|', 
-                                                    ['company_id', '=', hq_company_id], ['company_id', '=', False]]],
-                                                    {'limit': 1})
-                                                
-                                                if product_ids:
-                                                    line_vals.append((0, 0, {
-                                                        'product_id': product_ids[0],
-                                                        'quantity': len(data['lots']),
-                                                        'price_unit': data['unit_price'],
-                                                        'discount': data['discount'],
-                                                        'name': f"Damage - Lots: {', '.join(sorted(data['lots'])[:3])}" + ("..." if len(data['lots']) > 3 else ""),
-                                                    }))
-                                            
-                                            if line_vals:
-                                                credit_note_id = create_vendor_credit(
-                                                    st.session_state.models,
-                                                    vendor_name,
-                                                    credit_note_date.strftime('%Y-%m-%d'),
-                                                    due_date.strftime('%Y-%m-%d'),
-                                                    reference,
-                                                    line_vals,
-                                                    hq_company_id
-                                                )
-                                                
-                                                if credit_note_id:
-                                                    st.markdown(f"""
-                                                    <div class="success-box">
-                                                        <h3 style="margin: 0 0 15px 0;">✅ Credit Note Created Successfully!</h3>
-                                                        <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 15px;">
-                                                            <div><strong>🆔 Credit Note ID:</strong> {credit_note_id}</div>
-                                                            <div><strong>🏪 Vendor:</strong> {vendor_name}</div>
-                                                            <div><strong>📅 Date:</strong> {credit_note_date.strftime('%Y-%m-%d')}</div>
-                                                            <div><strong>📝 Reference:</strong> {reference}</div>
-                                                        </div>
-                                                        <div style="margin-top: 15px; text-align: center;">
-                                                            <strong>📦 Total Products:</strong> {len(line_vals)}
-                                                        </div>
-                                                    </div>
-                                                    """, unsafe_allow_html=True)
-                                            else:
-                                                st.error("❌ No valid products found to create credit note.")
+                            if st.button("🚀 Process & Create Credit Note", key="bulk_process_button", use_container_width=True, type="primary",
+                                         disabled=bool(bulk_running)):
+                                start_job(
+                                    'bulk_job', 'bulk', run_bulk_job,
+                                    run_key,
+                                    run_params,
+                                    lot_numbers,
+                                    st.session_state.client,
+                                    company_ids,
+                                    credit_note_date.strftime('%Y-%m-%d'),
+                                    due_date.strftime('%Y-%m-%d'),
+                                    reference,
+                                    start_fresh
+                                )
+                                st.rerun()
                 except Exception as e:
                     st.error(f"❌ Error processing file: {str(e)}")
             
+            # Bulk job status (reattached after reruns and page reloads)
+            bulk_job = attach_job('bulk_job')
+            if bulk_job:
+                if not bulk_job.finished:
+                    render_job_progress(bulk_job.id, show_partial_results=True)
+                else:
+                    bulk_state = bulk_job.snapshot()
+                    render_job_warnings(bulk_state)
+                    if bulk_state['error']:
+                        st.error(f"Error during lot number lookup: {bulk_state['error']}")
+                    elif not bulk_state['result']:
+                        st.warning("No matching lot numbers found.")
+                    for result in bulk_state['partial_results']:
+                        render_vendor_result(result)
+            
             st.markdown('</div>', unsafe_allow_html=True)
         
         with tab2:
@@ -622,20 +786,59 @@ def main():
                 lot_numbers = [lot.strip().upper() for lot in lot_input.split(',') if lot.strip()]
             
             if lot_numbers:
+                col1, col2 = st.columns(2)
+                with col1:
+                    full_lookup = st.checkbox(
+                        "🔁 Re-query all lots", key="manual_full_lookup",
+                        help="By default only lots not in the current results are looked up in Odoo"
+                    )
+                with col2:
+                    summary_lookup = st.checkbox(
+                        "⚡ Totals first", key="manual_summary_lookup",
+                        help="Count lots per product in Odoo and load lot numbers only for the rows you show or add"
+                    )
                 if st.button("🔍 Lookup Lot Numbers", key="manual_lookup_button", use_container_width=True):
-                    with st.spinner("🔄 Searching for lot numbers..."):
-                        st.session_state.grouped_data = lookup_lot_numbers(lot_numbers, st.session_state.models, hq_company_id)
-                        if st.session_state.grouped_data:
-                            st.success("✅ Lot numbers processed successfully!")
+                    previous = None if full_lookup else st.session_state.grouped_data
+                    start_job('lookup_job', 'lookup', run_lookup_job,
+                              lot_numbers, st.session_state.client, company_ids, previous, summary_lookup)
+                    st.rerun()
+            
+            # Lookup job status (reattached after reruns and page reloads)
+            lookup_job = attach_job('lookup_job')
+            if lookup_job:
+                if not lookup_job.finished:
+                    render_job_progress(lookup_job.id)
+                else:
+                    lookup_state = lookup_job.snapshot()
+                    render_job_warnings(lookup_state)
+                    if st.session_state.get('applied_lookup_job') != lookup_job.id:
+                        st.session_state.applied_lookup_job = lookup_job.id
+                        if lookup_state['error']:
+                            st.error(f"Error during lot number lookup: {lookup_state['error']}")
                         else:
-                            st.warning("No matching lot numbers found.")
+                            st.session_state.grouped_data, stats = lookup_state['result']
+                            prune_selected_products(st.session_state.grouped_data)
+                            if st.session_state.grouped_data:
+                                st.success(f"✅ Lot numbers processed successfully! {stats['looked_up']} looked up, "
+                                           f"{stats['reused']} reused, {stats['dropped']} removed.")
+                            else:
+                                st.warning("No matching lot numbers found.")
             
             # Display lookup results
             if st.session_state.grouped_data:
                 st.markdown('<h3 class="section-title">🔎 Lookup Results</h3>', unsafe_allow_html=True)
                 
+                # Results of several companies are shown one company at a time
+                result_companies = st.session_state.grouped_data.companies()
+                if len(result_companies) > 1:
+                    st.session_state.selected_company = st.selectbox(
+                        "Select Company:", result_companies, format_func=engine.get_company_name, key="manual_company_select")
+                else:
+                    st.session_state.selected_company = result_companies[0]
+                company_result = st.session_state.grouped_data.for_company(st.session_state.selected_company)
+                
                 # Collect all vendors from results
-                vendors = list(set([key[2] for key in st.session_state.grouped_data.keys()]))
+                vendors = company_result.vendors()
                 
                 if len(vendors) > 1:
                     st.session_state.selected_vendor = st.selectbox("Select Vendor:", vendors, key="manual_vendor_select")
@@ -643,61 +846,8 @@ def main():
                     st.session_state.selected_vendor = vendors[0]
                     st.info(f"Vendor: {st.session_state.selected_vendor}")
                 
-                # Filter data for selected vendor
-                vendor_data = {k: v for k, v in st.session_state.grouped_data.items() 
-                              if k[2] == st.session_state.selected_vendor}
-                
-                # Display results for selected vendor
-                for (po_name, product_name, vendor_name), data in vendor_data.items():
-                    with st.expander(f"📋 PO: {po_name} | 🧵 Product: {product_name}", expanded=False):
-                        st.markdown(f"""
-                        <div class="lot-card">
-                            <h4 style="color: #2c3e50; margin: 0 0 15px 0;">Product Details</h4>
-                            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px;">
-                                <div><strong>📋 PO:</strong> {po_name}</div>
-                                <div><strong>🏪 Vendor:</strong> {vendor_name}</div>
-                                <div><strong>🧵 Product:</strong> {product_name}</div>
-                                <div><strong>🔢 Lot Count:</strong> {len(data['lots'])}</div>
-                                <div><strong>💰 Unit Price:</strong> ₹{data['unit_price']:,.2f}</div>
-                                <div><strong>🎯 Discount:</strong> {data['discount']}%</div>
-                            </div>
-                            <div style="margin-top: 15px;">
-                                <strong>🏷️ Lot Numbers:</strong><br>
-                                <span style="font-family: monospace; background: #f8f9fa; padding: 5px; border-radius: 5px;">
-                                    {', '.join(sorted(data['lots']))}
-                                </span>
-                            </div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        if st.button(
-                            f"➕ Add to Credit Note", 
-                            key=f"add_{po_name}_{product_name}", 
-                            use_container_width=True
-                        ):
-                            new_product = {
-                                'po_name': po_name,
-                                'product_name': product_name,
-                                'lots': sorted(data['lots']),
-                                'count': len(data['lots']),
-                                'unit_price': data['unit_price'],
-                                'discount': data['discount']
-                            }
-                            
-                            # Check if product already exists
-                            existing = False
-                            for existing_product in st.session_state.selected_products:
-                                if (existing_product['po_name'] == po_name and 
-                                    existing_product['product_name'] == product_name):
-                                    existing = True
-                                    break
-                            
-                            if not existing:
-                                st.session_state.selected_products.append(new_product)
-                                st.success(f"✅ Added {product_name} to credit note!")
-                                st.rerun()
-                            else:
-                                st.warning("⚠️ Product already in credit note list!")
+                # Groups of the selected vendor
+                render_results_table(company_result.for_vendor(st.session_state.selected_vendor))
             
             # Create Credit Note Section
             st.markdown('<h3 class="section-title">📝 Create Credit Note</h3>', unsafe_allow_html=True)
@@ -725,13 +875,14 @@ def main():
                 reference = st.text_input("📝 Reference/Reason:", value="Damage", key="manual_reference")
                 
                 # Selected Products
-                if st.session_state.selected_products:
+                selected_groups = load_lots(get_selected_groups())
+                if selected_groups:
                     st.markdown('<h3 class="section-title">🛒 Selected Products</h3>', unsafe_allow_html=True)
                     
                     total_amount = 0
                     
-                    for idx, product in enumerate(st.session_state.selected_products):
-                        with st.expander(f"📦 {product['product_name']} (Qty: {product['count']})", expanded=True):
+                    for idx, product in enumerate(selected_groups):
+                        with st.expander(f"📦 {product.product_name} (Qty: {product.lot_count})", expanded=True):
                             col1, col2, col3 = st.columns([2, 1, 1])
                             
                             with col1:
@@ -740,20 +891,20 @@ def main():
                                     <div class="lot-card">
                                         <h4 style="color: #2c3e50; margin: 0 0 15px 0;">Product Information</h4>
                                         <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px;">
-                                            <div><strong>📋 PO:</strong> {product['po_name']}</div>
-                                            <div><strong>🧵 Product:</strong> {product['product_name']}</div>
-                                            <div><strong>🔢 Quantity:</strong> {product['count']}</div>
-                                            <div><strong>💰 Unit Price:</strong> ₹{product['unit_price']:,.2f}</div>
-                                            <div><strong>🎯 Discount:</strong> {product['discount']}%</div>
-                                            <div><strong>💵 Line Total:</strong> ₹{(product['unit_price'] * product['count'] * (1 - product['discount']/100)):,.2f}</div>
-                                            <div><strong>🏷️ Lots:</strong> {', '.join(product['lots'][:5])}</div>
+                                            <div><strong>📋 PO:</strong> {product.po_name}</div>
+                                            <div><strong>🧵 Product:</strong> {product.product_name}</div>
+                                            <div><strong>🔢 Quantity:</strong> {product.lot_count}</div>
+                                            <div><strong>💰 Unit Price:</strong> ₹{product.unit_price:,.2f}</div>
+                                            <div><strong>🎯 Discount:</strong> {product.discount}%</div>
+                                            <div><strong>💵 Line Total:</strong> ₹{product.line_total:,.2f}</div>
+                                            <div><strong>🏷️ Lots:</strong> {', '.join(product.lots[:5])}</div>
                                         </div>
                                     </div>
                                     """,
                                     unsafe_allow_html=True
                                 )
 
-                                total_amount += product['unit_price'] * product['count'] * (1 - product['discount']/100)
+                                total_amount += product.line_total
                             
                             # with col2:
                             #     # Quantity adjustment
@@ -772,7 +923,7 @@ def main():
                             
                             with col3:
                                 if st.button(f"🗑️ Remove", key=f"remove_{idx}", use_container_width=True):
-                                    st.session_state.selected_products.pop(idx)
+                                    st.session_state.selected_products.remove(product.key)
                                     st.success("✅ Product removed!")
                                     st.rerun()
                     
@@ -784,11 +935,11 @@ def main():
                         <div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 20px;">
                             <div>
                                 <h4 style="margin: 0;">📦 Total Products</h4>
-                                <h2 style="margin: 5px 0 0 0;">{len(st.session_state.selected_products)}</h2>
+                                <h2 style="margin: 5px 0 0 0;">{len(selected_groups)}</h2>
                             </div>
                             <div>
                                 <h4 style="margin: 0;">🔢 Total Items</h4>
-                                <h2 style="margin: 5px 0 0 0;">{sum(p['count'] for p in st.session_state.selected_products)}</h2>
+                                <h2 style="margin: 5px 0 0 0;">{sum(p.lot_count for p in selected_groups)}</h2>
                             </div>
                             <div>
                                 <h4 style="margin: 0;">💵 Total Amount</h4>
@@ -798,6 +949,14 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
                     
+                    # The credit note goes to the company the selected lots were found in
+                    credit_company_ids = sorted(set(group.company_id for group in selected_groups))
+                    if len(credit_company_ids) > 1:
+                        st.error(
+                            "❌ The selected products were found in several companies "
+                            f"({', '.join(engine.get_company_name(company_id) for company_id in credit_company_ids)}). "
+                            "Remove products until they all belong to one company; each company needs its own credit note.")
+
                     # Create Credit Note Button
                     col1, col2, col3 = st.columns([1, 2, 1])
                     with col2:
@@ -805,38 +964,25 @@ def main():
                             "🎯 Create Vendor Credit Note", 
                             key="manual_create_button", 
                             use_container_width=True, 
-                            type="primary"
+                            type="primary",
+                            disabled=len(credit_company_ids) != 1
                         ):
-                            with st.spinner("🔄 Creating credit note..."):
+                            with st.spinner("🔄 Creating credit note..."), trace_operation("Manual credit note"):
                                 # Prepare line values for Odoo
-                                line_vals = []
-                                for product in st.session_state.selected_products:
-                                    # Find product ID
-                                    product_ids = st.session_state.models.execute_kw(
-                                        CONFIG['db'], st.session_state.uid, CONFIG['password'],
-                                        'product.product', 'search',
-                                        [[['name', 'ilike', product['product_name']], '|', 
-                                          ['company_id', '=', hq_company_id], ['company_id', '=', False]]],
-                                        {'limit': 1})
-                                    
-                                    if product_ids:
-                                        line_vals.append((0, 0, {
-                                            'product_id': product_ids[0],
-                                            'quantity': product['count'],
-                                            'price_unit': product['unit_price'],
-                                            'discount': product['discount'],
-                                            'name': f"Damage - Lots: {', '.join(product['lots'][:3])}" + ("..." if len(product['lots']) > 3 else ""),
-                                        }))
+                                credit_company_id = credit_company_ids[0]
+                                product_ids = resolve_product_ids(
+                                    st.session_state.client, engine.missing_product_names(selected_groups), credit_company_id)
+                                line_vals = engine.build_credit_note_lines(selected_groups, product_ids)
                                 
                                 # Create Credit Note
                                 credit_note_id = create_vendor_credit(
-                                    st.session_state.models,
+                                    st.session_state.client,
                                     st.session_state.selected_vendor,
                                     credit_note_date.strftime('%Y-%m-%d'),
                                     due_date.strftime('%Y-%m-%d'),
                                     reference,
                                     line_vals,
-                                    hq_company_id
+                                    credit_company_id
                                 )
                                 
                                 if credit_note_id:
@@ -862,6 +1008,8 @@ def main():
                                     # Clear selected products after successful creation
                                     st.session_state.selected_products = []
                                     st.session_state.grouped_data = None
+                                    st.session_state.selected_company = None
+                                    st.query_params.pop('lookup_job', None)
                                     st.balloons()
                                     st.rerun()
                 else:
@@ -874,6 +1022,8 @@ def main():
                     """, unsafe_allow_html=True)
             
             st.markdown('</div>', unsafe_allow_html=True)
+        
+        render_diagnostics_panel()
     
     # Footer
     st.markdown("""
@@ -0,0 +1,151 @@
+"""Headless batch processing of lot files into vendor credit notes.
+
+Runs the same lookup and credit note engine as the Streamlit app and writes
+a machine-readable JSON results file, e.g. for nightly cron jobs:
+
+    python -m batch returns/*.xlsx --date 2024-03-31 --reference Damage -o results.json
+
+Runs are checkpointed: rerunning the same files with the same parameters
+after a failure skips the lookup and only creates the missing credit notes.
+"""
+import argparse
+import json
+import logging
+import sys
+from datetime import date, datetime, timedelta
+
+import engine
+from checkpoints import RunInProgressError
+from lot_files import read_lot_numbers
+from rpc_trace import trace_operation
+
+logger = logging.getLogger('batch')
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def read_lot_files(paths):
+    """Read and merge the lot numbers of several files, keeping first-seen order.
+
+    Returns ``(lot_numbers, reports, contents)`` where ``contents`` holds
+    the raw bytes of each file for the checkpoint key.
+    """
+    lot_numbers = {}
+    reports = []
+    contents = []
+    for path in paths:
+        with open(path, 'rb') as file:
+            contents.append(file.read())
+            file.seek(0)
+            lots, report = read_lot_numbers(file, path)
+        reports.append({'path': path, **report})
+        lot_numbers.update(dict.fromkeys(lots))
+    return list(lot_numbers), reports, contents
+
+def vendor_label(result):
+    return f"{result['vendor']} ({engine.get_company_name(result['company_id'])})"
+
+def run(args):
+    credit_note_date = args.date
+    due_date = args.due_date or credit_note_date + timedelta(days=30)
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'parameters': {
+            'credit_note_date': credit_note_date.isoformat(),
+            'due_date': due_date.isoformat(),
+            'reference': args.reference,
+            'dry_run': args.dry_run,
+            'summary': args.summary,
+        },
+        'files': [],
+        'warnings': [],
+        'groups': [],
+        'vendors': [],
+    }
+
+    def warn(message):
+        logger.warning(message)
+        results['warnings'].append(message)
+
+    lot_numbers, results['files'], contents = read_lot_files(args.files)
+    logger.info("Read %d unique lot numbers from %d file(s)", len(lot_numbers), len(args.files))
+
+    client = engine.create_odoo_client()
+    company_ids = list(engine.get_company_ids(client))
+    progress = lambda done, total: logger.info("Looked up lot chunk %d/%d", done, total)
+
+    if args.dry_run:
+        lookup = engine.summarize_lot_numbers if args.summary else engine.lookup_lot_numbers
+        grouped_data = lookup(lot_numbers, client, company_ids, warn=warn, progress=progress)
+        results['groups'] = grouped_data.to_records()
+        results['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        return results
+
+    run_key, run_params = engine.bulk_run_key(
+        contents, credit_note_date.strftime('%Y-%m-%d'), due_date.strftime('%Y-%m-%d'),
+        args.reference, company_ids)
+    results['checkpoint'] = run_key
+    journal = engine.get_checkpoint_journal()
+    # Raises RunInProgressError while the app or another batch process runs the same files
+    with journal.lock_run(run_key):
+        if args.fresh:
+            journal.discard(run_key)
+
+        grouped_data, product_ids, resumed = engine.plan_bulk_run(
+            run_key, run_params, lot_numbers, client, company_ids, progress=progress, warn=warn)
+        results['resumed'] = resumed
+        results['groups'] = grouped_data.to_records()
+
+        if grouped_data:
+            for result in journal.completed_results(run_key):
+                logger.info("%s: credit note %s already created by an earlier run", vendor_label(result), result['credit_note_id'])
+                results['vendors'].append(dict(result, resumed=True))
+
+            for result in engine.run_bulk_credits(
+                    run_key, client, grouped_data, product_ids,
+                    credit_note_date.strftime('%Y-%m-%d'), due_date.strftime('%Y-%m-%d'),
+                    args.reference):
+                if result['error']:
+                    logger.error("%s: %s", vendor_label(result), result['error'])
+                else:
+                    logger.info("%s: created credit note %s", vendor_label(result), result['credit_note_id'])
+                results['vendors'].append(result)
+
+    results['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create vendor credit notes from lot number files.")
+    parser.add_argument('files', nargs='+', help="Excel or CSV files with lot numbers in column A")
+    parser.add_argument('--date', type=parse_date, default=date.today(), help="credit note date (YYYY-MM-DD, default today)")
+    parser.add_argument('--due-date', type=parse_date, help="due date (YYYY-MM-DD, default date + 30 days)")
+    parser.add_argument('--reference', default='Damage', help="credit note reference/reason")
+    parser.add_argument('-o', '--output', help="write JSON results to this file instead of stdout")
+    parser.add_argument('--dry-run', action='store_true', help="look up lots only, do not create credit notes")
+    parser.add_argument('--summary', action='store_true', help="with --dry-run, report lot counts per group without the lot names")
+    parser.add_argument('--fresh', action='store_true', help="ignore the checkpoint of an earlier run of the same files")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+
+    with trace_operation('Batch run') as trace:
+        try:
+            results = run(args)
+        except RunInProgressError as e:
+            logger.error("%s", e)
+            return 1
+    # Per-operation aggregates only; the per-call list can be huge
+    results['diagnostics'] = {key: value for key, value in trace.summary().items() if key != 'calls'}
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    return 1 if any(result['error'] for result in results['vendors']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""Benchmark lot lookups (and optionally credit note creation) against a local fake Odoo.
+
+Starts benchmarks/fake_odoo.py in a subprocess seeded with the largest lot
+count, then for each size runs ``lookup_lot_numbers`` with cold caches and
+reports wall time, RPC count and client-side peak memory.
+
+    python benchmarks/bench_lookup.py --lots 100 1000 10000 50000 --latency 0.02 --bulk
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import engine
+from config import CONFIG
+from rpc_trace import trace_operation
+
+FAKE_ODOO = os.path.join(ROOT, 'benchmarks', 'fake_odoo.py')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_odoo(lot_count, latency, vendors, companies):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, FAKE_ODOO, '--lots', str(lot_count), '--port', str(port),
+         '--latency', str(latency), '--vendors', str(vendors), '--companies', str(companies)],
+        stdout=subprocess.PIPE, text=True)
+    # The server prints one line once it is listening
+    process.stdout.readline()
+    return process, f"http://127.0.0.1:{port}/"
+
+
+def configure(url, companies):
+    CONFIG.update({
+        'url': url,
+        'db': 'bench',
+        'username': 'bench',
+        'password': 'bench',
+        'hq_company_name': 'HQ',
+        'rpc_protocol': 'xmlrpc',
+        'lot_index_path': None,
+        'company_names': ['HQ'] + [f"Branch {number + 1}" for number in range(1, companies)],
+    })
+
+
+def measure(client, company_ids, lot_count, bulk):
+    lot_numbers = [f"LOT{number:07d}" for number in range(lot_count)]
+    engine.clear_caches()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with trace_operation(f"bench {lot_count}") as trace:
+        grouped_data = engine.lookup_lot_numbers(lot_numbers, client, company_ids, warn=lambda message: None)
+        lookup_time = time.perf_counter() - start
+        vendors = 0
+        if bulk and grouped_data:
+            product_ids = engine.resolve_result_product_ids(client, grouped_data)
+            vendors = sum(1 for _ in engine.create_vendor_credits(
+                client, grouped_data, product_ids, '2024-01-31', '2024-03-01', 'Benchmark'))
+    total_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    summary = trace.summary()
+    return {
+        'lots': lot_count,
+        'groups': len(grouped_data),
+        'vendors': vendors,
+        'lookup_s': lookup_time,
+        'total_s': total_time,
+        'rpc_calls': summary['rpc_calls'],
+        'rpc_kb': (summary['bytes_sent'] + summary['bytes_received']) / 1024,
+        'peak_mb': peak / 1024 / 1024,
+        'flags': summary['flags'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the fake server adds to every call")
+    parser.add_argument('--vendors', type=int, default=5)
+    parser.add_argument('--companies', type=int, default=1, help="look lots up in this many companies at once")
+    parser.add_argument('--bulk', action='store_true', help="also resolve products and create credit notes")
+    parser.add_argument('--url', help="use an already running fake server seeded with enough lots")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if not url:
+        process, url = start_fake_odoo(max(args.lots), args.latency, args.vendors, args.companies)
+    try:
+        configure(url, args.companies)
+        client = engine.create_odoo_client()
+        company_ids = list(engine.get_company_ids(client))
+        rows = [measure(client, company_ids, lot_count, args.bulk) for lot_count in args.lots]
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = f"{'lots':>7} {'groups':>7} {'vendors':>8} {'lookup s':>9} {'total s':>8} {'RPCs':>6} {'RPC KB':>9} {'peak MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['lots']:>7} {row['groups']:>7} {row['vendors']:>8} {row['lookup_s']:>9.2f} {row['total_s']:>8.2f} "
+              f"{row['rpc_calls']:>6} {row['rpc_kb']:>9.1f} {row['peak_mb']:>8.1f}")
+        for flag in row['flags']:
+            print(f"        {flag}")
+
+
+if __name__ == '__main__':
+    main()
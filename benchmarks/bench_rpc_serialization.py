@@ -0,0 +1,118 @@
+"""Compare XML-RPC and JSON-RPC serialization on typical lookup payloads.
+
+Builds synthetic ``stock.move.line`` search_read requests and responses of
+the shape ``lookup_lot_numbers`` exchanges with Odoo and measures, for each
+protocol, the encoded size, encode/decode time and peak memory of decoding.
+
+    python benchmarks/bench_rpc_serialization.py --lots 1000 10000 50000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import xmlrpc.client
+
+
+def make_payloads(lot_count):
+    lots = [f"LOT{i:07d}" for i in range(lot_count)]
+    params = (
+        'odoo', 2, 'secret', 'stock.move.line', 'search_read',
+        [[['lot_name', 'in', lots], ['company_id', '=', 1]]],
+        {'fields': ['lot_name', 'picking_id', 'product_id', 'move_id']},
+    )
+    result = [
+        {
+            'id': 100000 + i,
+            'lot_name': lot,
+            'picking_id': [3000 + i % 40, f"WH/IN/{i % 40:05d}"],
+            'product_id': [50000 + i % 300, f"Kanchipuram Silk Saree Style {i % 300} KSS-{i % 300:04d}"],
+            'move_id': [70000 + i // 3, f"WH/IN/{i % 40:05d}"],
+        }
+        for i, lot in enumerate(lots)
+    ]
+    return params, result
+
+
+def xmlrpc_codec(params, result):
+    return (
+        lambda: xmlrpc.client.dumps(params, 'execute_kw').encode(),
+        lambda: xmlrpc.client.dumps((result,), methodresponse=True).encode(),
+        lambda body: xmlrpc.client.loads(body)[0][0],
+    )
+
+
+def jsonrpc_codec(params, result):
+    request = {'jsonrpc': '2.0', 'method': 'call', 'id': 1,
+               'params': {'service': 'object', 'method': 'execute_kw', 'args': params}}
+    response = {'jsonrpc': '2.0', 'id': 1, 'result': result}
+    return (
+        lambda: json.dumps(request).encode(),
+        lambda: json.dumps(response).encode(),
+        lambda body: json.loads(body)['result'],
+    )
+
+
+CODECS = {
+    'xmlrpc': xmlrpc_codec,
+    'jsonrpc': jsonrpc_codec,
+}
+
+
+def timed(func, repeat):
+    best = float('inf')
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def measure(protocol, lot_count, repeat):
+    params, result = make_payloads(lot_count)
+    encode_request, encode_response, decode_response = CODECS[protocol](params, result)
+
+    request_time, request_body = timed(encode_request, repeat)
+    response_time, response_body = timed(encode_response, repeat)
+    decode_time, _ = timed(lambda: decode_response(response_body), repeat)
+
+    tracemalloc.start()
+    decode_response(response_body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'protocol': protocol,
+        'lots': lot_count,
+        'request_kb': len(request_body) / 1024,
+        'response_kb': len(response_body) / 1024,
+        'encode_ms': (request_time + response_time) * 1000,
+        'decode_ms': decode_time * 1000,
+        'decode_peak_mb': peak / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    rows = [measure(protocol, lot_count, args.repeat)
+            for lot_count in args.lots for protocol in CODECS]
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    header = f"{'protocol':<9} {'lots':>7} {'req KB':>9} {'resp KB':>9} {'encode ms':>10} {'decode ms':>10} {'peak MB':>8}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['protocol']:<9} {row['lots']:>7} {row['request_kb']:>9.1f} {row['response_kb']:>9.1f} "
+              f"{row['encode_ms']:>10.1f} {row['decode_ms']:>10.1f} {row['decode_peak_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+"""Local stand-in for an Odoo server, for offline benchmarks.
+
+Serves ``authenticate`` on /xmlrpc/2/common and ``execute_kw`` (search,
+search_read, read, read_group, create) on /xmlrpc/2/object over seeded synthetic data:
+vendors, POs with lines, receipts with moves and one move line per lot,
+spread over one or more companies (HQ, then ``Branch 2``, ``Branch 3``...).
+Lots are named ``LOT0000000``, ``LOT0000001``, ... so a benchmark can pick
+the first N without asking the server.
+
+    python benchmarks/fake_odoo.py --lots 50000 --port 8069 --latency 0.02
+"""
+import argparse
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+HQ_COMPANY_NAME = 'HQ'
+WRITE_DATE = '2024-01-01 00:00:00'
+EXCLUDED_VENDOR = 'Wedtree eStore Private Limited - HO'
+
+# Fields looked up through a hash index before the full domain is applied
+INDEXED_FIELDS = ('id', 'name', 'lot_name', 'order_id', 'picking_id', 'move_id', 'origin')
+
+
+def lot_name(number):
+    return f"LOT{number:07d}"
+
+
+def _value(record, field):
+    value = record.get(field, False)
+    # Many2one fields are stored as [id, name] and compared by ID
+    if isinstance(value, list) and len(value) == 2 and isinstance(value[0], int):
+        return value[0]
+    return value
+
+
+def _match_leaf(record, leaf):
+    field, operator, operand = leaf
+    value = _value(record, field)
+    if operator == '=':
+        return value == operand if operand is not False else not value
+    if operator == '!=':
+        return value != operand if operand is not False else bool(value)
+    if operator == 'in':
+        return value in operand
+    if operator == 'not in':
+        return value not in operand
+    if operator in ('ilike', 'like'):
+        return str(operand).lower() in str(value or '').lower()
+    if operator in ('>', '>=', '<', '<='):
+        if value is False or value is None:
+            return False
+        return {'>': value > operand, '>=': value >= operand,
+                '<': value < operand, '<=': value <= operand}[operator]
+    raise ValueError(f"Unsupported operator: {operator}")
+
+
+def match(record, domain):
+    """Evaluate a prefix-notation Odoo domain with implicit AND between terms"""
+    def evaluate(position):
+        term = domain[position]
+        if term in ('|', '&'):
+            left, position = evaluate(position + 1)
+            right, position = evaluate(position)
+            return (left or right) if term == '|' else (left and right), position
+        if term == '!':
+            value, position = evaluate(position + 1)
+            return not value, position
+        return _match_leaf(record, term), position + 1
+
+    position = 0
+    while position < len(domain):
+        value, position = evaluate(position)
+        if not value:
+            return False
+    return True
+
+
+class FakeOdoo:
+    """In-memory Odoo models with call counting and optional per-call latency"""
+
+    def __init__(self, lots=1000, vendors=5, pos=None, lines_per_po=20, unlinked_ratio=0.1,
+                 latency=0.0, seed=42, companies=1):
+        self.latency = latency
+        self.calls = Counter()
+        self.tables = defaultdict(dict)
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._seed(random.Random(seed), lots, vendors, pos or max(lots // 500, 5), lines_per_po, unlinked_ratio,
+                   companies)
+
+    def _insert(self, model, values):
+        table = self.tables[model]
+        record_id = values.get('id') or len(table) + 1
+        table[record_id] = dict(values, id=record_id)
+        return record_id
+
+    def _seed(self, rng, lot_count, vendor_count, po_count, lines_per_po, unlinked_ratio, company_count):
+        companies = []
+        for number in range(company_count):
+            name = HQ_COMPANY_NAME if number == 0 else f"Branch {number + 1}"
+            company = [self._insert('res.company', {'name': name}), name]
+            self._insert('account.journal', {'name': 'Vendor Bills', 'type': 'purchase', 'company_id': company})
+            companies.append(company)
+
+        vendors = []
+        for number in range(vendor_count):
+            name = f"Vendor {number + 1:03d}"
+            vendors.append([self._insert('res.partner', {'name': name, 'company_id': False}), name])
+        excluded = [self._insert('res.partner', {'name': EXCLUDED_VENDOR, 'company_id': False}), EXCLUDED_VENDOR]
+
+        move_ids = []
+        for po_number in range(po_count):
+            # Every 20th receipt comes from an internal company and is filtered out
+            partner = excluded if po_number % 20 == 19 else vendors[po_number % vendor_count]
+            po_name = f"P{po_number + 1:05d}"
+            company = companies[po_number % company_count]
+            po_id = self._insert('purchase.order', {
+                'name': po_name, 'partner_id': partner, 'company_id': company, 'write_date': WRITE_DATE,
+            })
+            picking_name = f"WH/IN/{po_number + 1:05d}"
+            picking_id = self._insert('stock.picking', {
+                'name': picking_name, 'origin': po_name, 'partner_id': partner, 'company_id': company,
+            })
+
+            for line_number in range(lines_per_po):
+                style = po_number * lines_per_po + line_number
+                product_name = f"Silk Saree Style {style} SKU{style:05d}"
+                template_id = self._insert('product.template', {'name': product_name})
+                product_id = self._insert('product.product', {
+                    'name': product_name, 'product_tmpl_id': [template_id, product_name], 'company_id': False,
+                })
+                line_id = self._insert('purchase.order.line', {
+                    'order_id': [po_id, po_name],
+                    'product_id': [product_id, product_name],
+                    'product_template_id': [template_id, product_name],
+                    'price_unit': float(rng.randrange(500, 5000)),
+                    'discount': float(rng.choice([0, 0, 5, 10])),
+                    'write_date': WRITE_DATE,
+                })
+                linked = rng.random() >= unlinked_ratio
+                move_ids.append(self._insert('stock.move', {
+                    'product_id': [product_id, product_name],
+                    'picking_id': [picking_id, picking_name],
+                    'company_id': company,
+                    'purchase_line_id': [line_id, product_name] if linked else False,
+                }))
+
+        moves = self.tables['stock.move']
+        for number in range(lot_count):
+            move = moves[move_ids[number % len(move_ids)]]
+            self._insert('stock.move.line', {
+                'lot_name': lot_name(number),
+                'picking_id': move['picking_id'],
+                'product_id': move['product_id'],
+                'move_id': [move['id'], move['picking_id'][1]],
+                'company_id': move['company_id'],
+                'write_date': WRITE_DATE,
+            })
+
+    # === Query Evaluation ===
+    def _index(self, model, field):
+        key = (model, field)
+        if key not in self._indexes:
+            index = defaultdict(list)
+            for record in self.tables[model].values():
+                value = _value(record, field)
+                if isinstance(value, (int, str)):
+                    index[value].append(record)
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def _candidates(self, model, domain):
+        """Narrow the scan with the first indexable top-level leaf of a pure-AND domain"""
+        if any(term in ('|', '&', '!') for term in domain):
+            return self.tables[model].values()
+        for field, operator, operand in domain:
+            if field in INDEXED_FIELDS and operator in ('=', 'in') and operand is not False:
+                index = self._index(model, field)
+                values = operand if operator == 'in' else [operand]
+                return [record for value in set(values) for record in index.get(value, ())]
+        return self.tables[model].values()
+
+    def _search(self, model, domain, offset=0, limit=None, order=None):
+        records = [record for record in self._candidates(model, domain) if match(record, domain)]
+        records.sort(key=lambda record: record['id'])
+        if order:
+            for part in reversed(order.split(',')):
+                field, _, direction = part.strip().partition(' ')
+                records.sort(key=lambda record: _value(record, field) or '', reverse=direction.lower() == 'desc')
+        records = records[offset:]
+        return records[:limit] if limit else records
+
+    def _read_group(self, model, domain, fields, groupby):
+        """Non-lazy read_group supporting ``field:count``/``field:count_distinct``/``field:sum`` aggregates"""
+        groups = {}
+        for record in self._search(model, domain):
+            key = tuple(_value(record, field) for field in groupby)
+            groups.setdefault(key, []).append(record)
+
+        result = []
+        for records in groups.values():
+            row = {field: records[0].get(field, False) for field in groupby}
+            row['__count'] = len(records)
+            for spec in fields:
+                field, _, aggregate = spec.partition(':')
+                values = [record.get(field, False) for record in records]
+                if aggregate == 'count_distinct':
+                    row[field] = len(set(value for value in values if value is not False))
+                elif aggregate == 'count':
+                    row[field] = sum(1 for value in values if value is not False)
+                elif aggregate == 'sum':
+                    row[field] = sum(value or 0 for value in values)
+            result.append(row)
+        return result
+
+    def _many2ones(self, values):
+        """Store IDs written to ``*_id`` fields as [id, name] like the seeded records"""
+        return {
+            field: [value, self._display_name(field, value)]
+            if field.endswith('_id') and isinstance(value, int) and not isinstance(value, bool) else value
+            for field, value in values.items()
+        }
+
+    def _display_name(self, field, record_id):
+        model = {'partner_id': 'res.partner', 'company_id': 'res.company', 'journal_id': 'account.journal',
+                 'product_id': 'product.product'}.get(field)
+        return self.tables[model].get(record_id, {}).get('name', '') if model else ''
+
+    @staticmethod
+    def _project(record, fields):
+        if not fields:
+            return dict(record)
+        return {'id': record['id'], **{field: record.get(field, False) for field in fields}}
+
+    # === RPC Entry Points ===
+    def authenticate(self, db, username, password, user_agent_env):
+        return 2
+
+    def execute_kw(self, db, uid, password, model, method, args, kwargs=None):
+        kwargs = kwargs or {}
+        self.calls[(model, method)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            if method == 'search':
+                return [record['id'] for record in self._search(
+                    model, args[0], kwargs.get('offset', 0), kwargs.get('limit'), kwargs.get('order'))]
+            if method == 'search_read':
+                return [self._project(record, kwargs.get('fields')) for record in self._search(
+                    model, args[0], kwargs.get('offset', 0), kwargs.get('limit'), kwargs.get('order'))]
+            if method == 'read_group':
+                fields = args[1] if len(args) > 1 else kwargs.get('fields', [])
+                groupby = args[2] if len(args) > 2 else kwargs.get('groupby', [])
+                return self._read_group(model, args[0], fields, [groupby] if isinstance(groupby, str) else groupby)
+            if method == 'read':
+                table = self.tables[model]
+                return [self._project(table[record_id], kwargs.get('fields'))
+                        for record_id in args[0] if record_id in table]
+            if method == 'create':
+                values = args[0]
+                ids = [self._insert(model, dict(self._many2ones(record), write_date=WRITE_DATE))
+                       for record in (values if isinstance(values, list) else [values])]
+                self._indexes = {key: index for key, index in self._indexes.items() if key[0] != model}
+                return ids if isinstance(values, list) else ids[0]
+        raise ValueError(f"Unsupported method: {method}")
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc/2/common', '/xmlrpc/2/object')
+    protocol_version = 'HTTP/1.1'
+
+
+def serve(odoo, host='127.0.0.1', port=0):
+    """Start serving ``odoo`` on a background thread; returns ``(server, url)``"""
+    server = _Server((host, port), requestHandler=_RequestHandler, allow_none=True, logRequests=False)
+    server.register_function(odoo.authenticate, 'authenticate')
+    server.register_function(odoo.execute_kw, 'execute_kw')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=1000)
+    parser.add_argument('--vendors', type=int, default=5)
+    parser.add_argument('--lines-per-po', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--companies', type=int, default=1, help="spread POs and lots over this many companies")
+    parser.add_argument('--port', type=int, default=8069)
+    args = parser.parse_args()
+
+    odoo = FakeOdoo(args.lots, args.vendors, lines_per_po=args.lines_per_po, latency=args.latency, seed=args.seed,
+                    companies=args.companies)
+    server, url = serve(odoo, port=args.port)
+    print(f"Fake Odoo with {args.lots} lots listening on {url} (db: any, login: any, company: {HQ_COMPANY_NAME})", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from lookup_result import LookupResult
+
+try:
+    import fcntl
+except ImportError:  # Windows: runs are only guarded within one process
+    fcntl = None
+
+
+def run_key(file_contents, params):
+    """Hash the input files' bytes and the run parameters into a checkpoint key"""
+    digest = hashlib.sha256()
+    for content in file_contents:
+        digest.update(hashlib.sha256(content).digest())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class RunInProgressError(Exception):
+    """Raised when a bulk run is started while another run with the same key is still going"""
+
+
+class CheckpointJournal:
+    """Persistent journal of bulk runs, one JSON file per run key.
+
+    A checkpoint holds the resolved lookup plan (groups and product IDs)
+    and the outcome of every vendor processed so far, so a rerun with the
+    same files and parameters skips the lookup and only retries vendors
+    without a credit note, except those whose create had an unknown
+    outcome. Files are replaced atomically after each write.
+
+    Only one run per key may plan and create credit notes at a time, see
+    ``lock_run``.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._running = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read(self, key):
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, key, checkpoint):
+        path = self._path(key)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(checkpoint, file, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def _lock_path(self, key):
+        return os.path.join(self.directory, f"{key}.lock")
+
+    @contextmanager
+    def lock_run(self, key):
+        """Hold the run's lock while the block runs; raises RunInProgressError when another run holds it.
+
+        Runs are guarded within this process and, through an flock on a
+        ``.lock`` file next to the checkpoint, against other processes such
+        as the batch CLI.
+        """
+        with self._lock:
+            if key in self._running:
+                raise RunInProgressError("A bulk run of these files with these parameters is already in progress")
+            self._running.add(key)
+        lock_file = None
+        try:
+            if fcntl:
+                lock_file = open(self._lock_path(key), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise RunInProgressError(
+                        "A bulk run of these files with these parameters is already in progress in another process")
+            yield
+        finally:
+            if lock_file:
+                lock_file.close()
+            with self._lock:
+                self._running.discard(key)
+
+    def is_running(self, key):
+        """Whether a run with this key holds its lock in this process"""
+        with self._lock:
+            return key in self._running
+
+    def load(self, key):
+        with self._lock:
+            return self._read(key)
+
+    def discard(self, key):
+        with self._lock:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def save_plan(self, key, params, lookup_result, product_ids):
+        with self._lock:
+            self._write(key, {
+                'key': key,
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'params': params,
+                'groups': lookup_result.to_records(),
+                # JSON object keys are strings, so company IDs are stored as pairs
+                'company_product_ids': [[company_id, ids] for company_id, ids in product_ids.items()],
+                'vendors': {},
+            })
+
+    def load_plan(self, key):
+        """Return ``(lookup_result, product_ids)`` of a saved plan, or None"""
+        checkpoint = self.load(key)
+        if not checkpoint:
+            return None
+        product_ids = {company_id: ids for company_id, ids in checkpoint['company_product_ids']}
+        return LookupResult.from_records(checkpoint['groups']), product_ids
+
+    def record_vendor(self, key, result):
+        with self._lock:
+            checkpoint = self._read(key)
+            checkpoint['vendors'][f"{result['company_id']}/{result['vendor']}"] = dict(
+                result, recorded_at=datetime.now().isoformat(timespec='seconds'))
+            self._write(key, checkpoint)
+
+    def completed_results(self, key):
+        """Return the recorded results of company vendors that already have a credit note"""
+        checkpoint = self.load(key)
+        if not checkpoint:
+            return []
+        return [result for result in checkpoint['vendors'].values() if result['credit_note_id']]
+
+    def unknown_results(self, key):
+        """Return the recorded results of company vendors whose credit note may or may not have been created"""
+        checkpoint = self.load(key)
+        if not checkpoint:
+            return []
+        return [
+            result for result in checkpoint['vendors'].values()
+            if not result['credit_note_id'] and result['outcome'] == 'unknown'
+        ]
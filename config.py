@@ -0,0 +1,60 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# === Config ===
+CONFIG = {
+    'url': os.getenv('ODOO_URL'),
+    'db': os.getenv('ODOO_DB'),
+    'username': os.getenv('ODOO_USERNAME'),
+    'password': os.getenv('ODOO_PASSWORD'),
+    'hq_company_name': os.getenv('HQ_COMPANY_NAME'),
+    # Comma-separated companies to look lots up in at once; empty means the HQ company only
+    'company_names': [name.strip() for name in os.getenv('COMPANY_NAMES', '').split(',') if name.strip()],
+    'app_username': os.getenv('APP_USERNAME'),
+    'app_password': os.getenv('APP_PASSWORD'),
+    'lot_chunk_size': int(os.getenv('LOT_CHUNK_SIZE', '1000')),
+    'lookup_workers': int(os.getenv('LOOKUP_WORKERS', '4')),
+    'pool_size': int(os.getenv('ODOO_POOL_SIZE', '8')),
+    'rpc_protocol': os.getenv('ODOO_RPC_PROTOCOL', 'xmlrpc'),
+    'vendor_workers': int(os.getenv('VENDOR_WORKERS', '4')),
+    'credit_note_batch_size': int(os.getenv('CREDIT_NOTE_BATCH_SIZE', '25')),
+    'job_workers': int(os.getenv('JOB_WORKERS', '2')),
+    'lot_index_path': os.getenv('LOT_INDEX_PATH'),
+    'lot_index_sync_interval': int(os.getenv('LOT_INDEX_SYNC_INTERVAL', '60')),
+    'price_cache_path': os.getenv('PRICE_CACHE_PATH', ':memory:'),
+    'price_cache_sync_interval': int(os.getenv('PRICE_CACHE_SYNC_INTERVAL', '60')),
+    # Purchase orders whose line index is kept in memory; the least recently used are evicted
+    'po_index_cache_size': int(os.getenv('PO_INDEX_CACHE_SIZE', '2048')),
+    'checkpoint_dir': os.getenv('CHECKPOINT_DIR', '.checkpoints'),
+    # Seconds to wait on an Odoo response before the call fails with a timeout
+    'timeout': float(os.getenv('ODOO_TIMEOUT', '120')),
+    'max_retries': int(os.getenv('ODOO_MAX_RETRIES', '4')),
+    'retry_base_delay': float(os.getenv('ODOO_RETRY_BASE_DELAY', '0.5')),
+    'retry_max_delay': float(os.getenv('ODOO_RETRY_MAX_DELAY', '30')),
+    'rate_limit': float(os.getenv('ODOO_RATE_LIMIT', '0')),
+    'rate_burst': int(os.getenv('ODOO_RATE_BURST', '0')) or None,
+}
+
+# === Vendor Names to Exclude ===
+EXCLUDED_PARTNER_NAMES = [
+    "Wedtree eStore Private Limited - HO",
+    "Wedtree eStore Private Limited - Coimbatore",
+    "Wedtree eStore Private Limited - T Nagar",
+    "Wedtree eStore Private Limited - Online",
+    "Wedtree eStore Private Limited - Vizag",
+    "Saree Trails",
+    "Wedtree eStore Private Limited - Malleshwaram",
+    "Wedtree eStore Private Limited - Jayanagar",
+    "Wedtree eStore Private Limited - Hyderabad"
+]
+
+# === Master Data Cache TTLs (seconds) ===
+MASTER_DATA_TTLS = {
+    'company': 24 * 3600,
+    'journal': 6 * 3600,
+    'partner': 3600,
+    'product': 3600,
+}
@@ -0,0 +1,1030 @@
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from checkpoints import CheckpointJournal, run_key
+from config import CONFIG, EXCLUDED_PARTNER_NAMES, MASTER_DATA_TTLS
+from lot_index import LotIndex
+from lookup_result import LookupResult, LookupResultBuilder
+from master_data import MasterDataCache
+from odoo_client import create_client
+from price_cache import PO_LINE_FIELDS, PriceCache
+from rpc_control import CallPolicy, classify_error
+from rpc_trace import submit_traced
+
+logger = logging.getLogger(__name__)
+
+# === Helper Functions ===
+def extract_sku_from_product_name(product_name):
+    if not product_name:
+        return "N/A"
+    match = re.search(r'([A-Za-z0-9\-]+)$', product_name.strip())
+    return match.group(1) if match else "N/A"
+
+# === Odoo Connection & Master Data ===
+def create_odoo_client():
+    """Build and authenticate an Odoo client from CONFIG"""
+    policy = CallPolicy(
+        max_retries=CONFIG['max_retries'],
+        base_delay=CONFIG['retry_base_delay'],
+        max_delay=CONFIG['retry_max_delay'],
+        rate_limit=CONFIG['rate_limit'],
+        burst=CONFIG['rate_burst'],
+        max_concurrency=CONFIG['pool_size'],
+    )
+    return create_client(CONFIG['rpc_protocol'], CONFIG['url'], CONFIG['db'],
+                         CONFIG['username'], CONFIG['password'], CONFIG['pool_size'], policy, CONFIG['timeout'])
+
+# Process-wide cache of company, journal, partner and product IDs
+_master_data_cache = MasterDataCache(MASTER_DATA_TTLS)
+
+def get_master_data_cache():
+    return _master_data_cache
+
+# Optional SQLite lot index, opened on first use when LOT_INDEX_PATH is set
+_lot_index = None
+_lot_index_lock = threading.Lock()
+
+def get_lot_index():
+    global _lot_index
+    if not CONFIG['lot_index_path']:
+        return None
+    with _lot_index_lock:
+        if _lot_index is None:
+            _lot_index = LotIndex(CONFIG['lot_index_path'])
+        return _lot_index
+
+# Names of the companies resolved so far, for messages: {company_id: name}
+_company_names = {}
+
+def get_company_ids(client):
+    """Return ``{company_id: name}`` for the companies lots are looked up in.
+
+    These are the COMPANY_NAMES companies, or just the HQ company when it is
+    empty. Cache misses are resolved in one search_read; raises LookupError
+    naming every company that does not exist.
+    """
+    names = CONFIG['company_names'] or [CONFIG['hq_company_name']]
+    master_data = get_master_data_cache()
+    company_ids = {name: master_data.get('company', name) for name in names}
+
+    missing = [name for name, ids in company_ids.items() if not ids]
+    if missing:
+        for company in client.search_read('res.company', [['name', 'in', missing]], ['id', 'name']):
+            if not company_ids.get(company['name']):
+                company_ids[company['name']] = [company['id']]
+                master_data.set('company', company['name'], [company['id']])
+
+    not_found = [name for name in names if not company_ids.get(name)]
+    if not_found:
+        raise LookupError(f"Failed to find company: {', '.join(not_found)}")
+    companies = {company_ids[name][0]: name for name in names}
+    _company_names.update(companies)
+    return companies
+
+def get_company_name(company_id):
+    return _company_names.get(company_id, f"#{company_id}")
+
+def as_company_ids(company_id):
+    """Lookups take one company ID or a list of them; return them as a list"""
+    return list(company_id) if isinstance(company_id, (list, tuple)) else [company_id]
+
+# === Purchase Order Matching ===
+def normalize_product_name(name):
+    return ' '.join((name or '').lower().split())
+
+def build_po_line_index(lines):
+    """Index PO lines for name/SKU matching.
+
+    Precedence for a product: exact normalized template name, then exact
+    SKU, then the old substring check. When several lines share a key the
+    first line in PO order wins, as the original linear scan did.
+    """
+    index = {'names': {}, 'skus': {}, 'lines': [], 'fallback': {}}
+    for line in lines:
+        if not line['product_template_id']:
+            continue
+        index['lines'].append(line)
+        line_product = line['product_template_id'][1]
+        index['names'].setdefault(normalize_product_name(line_product), line)
+        sku = extract_sku_from_product_name(line_product)
+        if sku != "N/A":
+            index['skus'].setdefault(sku, line)
+    return index
+
+def match_po_line(index, product_name):
+    """Return the PO line matching a product name, or None"""
+    line = index['names'].get(normalize_product_name(product_name))
+    if line:
+        return line
+
+    sku = extract_sku_from_product_name(product_name)
+    line = index['skus'].get(sku)
+    if line:
+        return line
+
+    # Substring check, evaluated once per product name
+    if product_name not in index['fallback']:
+        product_lower = product_name.lower()
+        index['fallback'][product_name] = next((
+            candidate for candidate in index['lines']
+            if sku in candidate['product_template_id'][1] or product_lower in candidate['product_template_id'][1].lower()
+        ), None)
+    return index['fallback'][product_name]
+
+# PO line indexes shared across lookups, least recently used first: {po_id: (write_date, index)}
+_po_index_cache = OrderedDict()
+_po_index_lock = threading.Lock()
+
+def _drop_po_indexes(order_ids):
+    with _po_index_lock:
+        for order_id in order_ids:
+            _po_index_cache.pop(order_id, None)
+
+# PO line prices shared across lookups, invalidated together with the PO line indexes
+_price_cache = None
+_price_cache_lock = threading.Lock()
+
+def get_price_cache():
+    global _price_cache
+    if not CONFIG['price_cache_path']:
+        return None
+    with _price_cache_lock:
+        if _price_cache is None:
+            _price_cache = PriceCache(CONFIG['price_cache_path'], CONFIG['price_cache_sync_interval'],
+                                      on_invalidate=_drop_po_indexes)
+        return _price_cache
+
+def clear_caches():
+    """Drop the process-wide master data, PO line index and price caches"""
+    get_master_data_cache().clear()
+    with _po_index_lock:
+        _po_index_cache.clear()
+    price_cache = get_price_cache()
+    if price_cache:
+        price_cache.clear()
+
+def fetch_po_line_indexes(client, po_names):
+    """Fetch purchase orders by name and a line index for each of them.
+
+    Indexes are reused across lookups until the PO's write_date changes;
+    at most PO_INDEX_CACHE_SIZE of them are kept, least recently used
+    evicted first.
+    The lines read for stale POs also refresh the price cache, and a
+    modified PO drops its cached prices.
+    """
+    po_names = sorted(set(name for name in po_names if name))
+    if not po_names:
+        return {}, {}
+
+    # Drops the indexes of POs whose lines changed since the last refresh
+    price_cache = get_price_cache()
+    if price_cache:
+        price_cache.refresh(client)
+
+    orders = client.search_read('purchase.order',
+        [['name', 'in', po_names]],
+        ['id', 'name', 'write_date'])
+    po_map = {}
+    for order in orders:
+        po_map.setdefault(order['name'], order)
+
+    po_indexes = {}
+    stale_ids = []
+    modified_ids = []
+    with _po_index_lock:
+        for order in po_map.values():
+            cached = _po_index_cache.get(order['id'])
+            if cached and cached[0] == order['write_date']:
+                _po_index_cache.move_to_end(order['id'])
+                po_indexes[order['id']] = cached[1]
+            else:
+                stale_ids.append(order['id'])
+                if cached:
+                    modified_ids.append(order['id'])
+
+    if price_cache and modified_ids:
+        price_cache.invalidate_orders(modified_ids, notify=False)
+
+    if stale_ids:
+        lines = client.search_read('purchase.order.line',
+            [['order_id', 'in', stale_ids]],
+            PO_LINE_FIELDS)
+        if price_cache:
+            price_cache.store(lines)
+        lines_by_order = defaultdict(list)
+        for line in lines:
+            lines_by_order[line['order_id'][0]].append(line)
+
+        write_dates = {order['id']: order['write_date'] for order in po_map.values()}
+        with _po_index_lock:
+            for po_id in stale_ids:
+                index = build_po_line_index(lines_by_order[po_id])
+                _po_index_cache[po_id] = (write_dates[po_id], index)
+                _po_index_cache.move_to_end(po_id)
+                po_indexes[po_id] = index
+            while len(_po_index_cache) > CONFIG['po_index_cache_size']:
+                _po_index_cache.popitem(last=False)
+
+    return po_map, po_indexes
+
+def fetch_purchase_links(client, move_ids):
+    """Map stock move IDs to the purchase order lines they were received from"""
+    move_ids = list(set(move_ids))
+    if not move_ids:
+        return {}
+
+    moves = client.read('stock.move', move_ids, ['purchase_line_id'])
+    move_line_map = {m['id']: m['purchase_line_id'][0] for m in moves if m['purchase_line_id']}
+    if not move_line_map:
+        return {}
+
+    price_cache = get_price_cache()
+    if price_cache:
+        line_map = price_cache.get_lines(client, move_line_map.values())
+    else:
+        lines = client.read('purchase.order.line', list(set(move_line_map.values())), PO_LINE_FIELDS)
+        line_map = {line['id']: line for line in lines}
+
+    return {
+        move_id: line_map[line_id]
+        for move_id, line_id in move_line_map.items()
+        if line_id in line_map
+    }
+
+# === Lot Lookup ===
+def fetch_move_lines_chunk(client, lot_chunk, company_id):
+    """Fetch stock move lines for one chunk of lot numbers in one or more companies"""
+    return client.search_read('stock.move.line',
+        [
+            ['lot_name', 'in', lot_chunk],
+            ['company_id', 'in', as_company_ids(company_id)]
+        ],
+        ['lot_name', 'picking_id', 'product_id', 'move_id', 'write_date', 'company_id'])
+
+def fetch_indexed_move_lines(lot_numbers, client, company_ids):
+    """Serve move lines from the lot index when it is enabled and built for every company.
+
+    The index is synced first. Returns ``(move_lines, missing_lots)``; when
+    the index cannot be used nothing is served and every lot is missing.
+    """
+    lot_index = get_lot_index()
+    if not lot_index or not all(lot_index.is_built(company) for company in company_ids):
+        return [], lot_numbers
+
+    for company in company_ids:
+        lot_index.sync(client, company, max_age=CONFIG['lot_index_sync_interval'])
+    move_lines, lot_numbers = lot_index.lookup(lot_numbers, company_ids)
+    logger.info("Lot index served %d move lines, %d lots left for Odoo", len(move_lines), len(lot_numbers))
+    return move_lines, lot_numbers
+
+def read_pickings(client, picking_ids):
+    pickings = client.read('stock.picking', list(picking_ids), ['id', 'name', 'origin', 'partner_id'])
+    return {p['id']: p for p in pickings}
+
+def read_product_names(client, product_ids):
+    products = client.read('product.product', list(product_ids), ['id', 'name'])
+    return {p['id']: p['name'] for p in products}
+
+def included_move_lines(move_lines, picking_map):
+    """Move lines of known pickings whose partner is not excluded"""
+    return [
+        ml for ml in move_lines
+        if ml['picking_id'] and ml['picking_id'][0] in picking_map
+        and picking_map[ml['picking_id'][0]]['partner_id']
+        and picking_map[ml['picking_id'][0]]['partner_id'][1] not in EXCLUDED_PARTNER_NAMES
+    ]
+
+def unlinked_move_lines(move_lines, purchase_links):
+    return [ml for ml in move_lines if not ml['move_id'] or ml['move_id'][0] not in purchase_links]
+
+def resolve_purchase_lines(client, move_lines, warn):
+    """Yield ``(move_line, po_name, product_name, vendor_name, po_line)`` for move lines traced back to a PO line.
+
+    Move lines (or aggregated move line rows) need ``picking_id``,
+    ``product_id`` and ``move_id``. Lines received from excluded partners
+    are skipped, and lines whose PO or PO line cannot be found are
+    reported through ``warn`` and skipped.
+    """
+    # Fetch Picking Details
+    picking_map = read_pickings(client, set(ml['picking_id'][0] for ml in move_lines if ml['picking_id']))
+    move_lines = included_move_lines(move_lines, picking_map)
+
+    # Exact linkage: stock.move -> purchase.order.line
+    purchase_links = fetch_purchase_links(
+        client, [ml['move_id'][0] for ml in move_lines if ml['move_id']])
+    unlinked_lines = unlinked_move_lines(move_lines, purchase_links)
+
+    # Fallback data for moves without a purchase link
+    product_map = {}
+    po_map, po_indexes = {}, {}
+    if unlinked_lines:
+        product_map = read_product_names(
+            client, set(ml['product_id'][0] for ml in unlinked_lines if ml['product_id']))
+        origins = [picking_map[ml['picking_id'][0]]['origin'] for ml in unlinked_lines]
+        po_map, po_indexes = fetch_po_line_indexes(client, origins)
+
+    yield from match_purchase_lines(move_lines, picking_map, purchase_links, product_map, po_map, po_indexes, warn)
+
+def match_purchase_lines(move_lines, picking_map, purchase_links, product_map, po_map, po_indexes, warn):
+    """Trace move lines to PO lines using already fetched pickings, purchase links, product names and PO line indexes"""
+    missing_pos = set()
+    for ml in move_lines:
+        picking = picking_map[ml['picking_id'][0]]
+        vendor_name = picking['partner_id'][1] if picking['partner_id'] else "Unknown Vendor"
+
+        line = purchase_links.get(ml['move_id'][0]) if ml['move_id'] else None
+        if line:
+            po_name = line['order_id'][1] if line['order_id'] else picking['origin']
+        else:
+            # Name/SKU heuristic for moves with no purchase link
+            product_id = ml['product_id'][0] if ml['product_id'] else None
+            product_name = product_map.get(product_id, 'N/A')
+            po_name = picking['origin']
+
+            po = po_map.get(po_name)
+            if not po:
+                if po_name not in missing_pos:
+                    missing_pos.add(po_name)
+                    warn(f"PO '{po_name}' not found for picking {picking['name']}")
+                continue
+
+            line = match_po_line(po_indexes[po['id']], product_name)
+            if not line:
+                lots = f"Lot: {ml['lot_name']}" if 'lot_name' in ml else f"{ml['lot_count']} lots"
+                warn(f"No matching PO line found for product '{product_name}' ({lots})")
+                continue
+
+        line_product = line['product_template_id'][1] if line['product_template_id'] else ''
+        yield ml, po_name, line_product, vendor_name, line
+
+def lookup_lot_numbers(lot_numbers, client, company_id, progress=None, warn=None):
+    """Resolve lot numbers to a LookupResult of (po_name, product_name, vendor_name, company_id) groups.
+
+    ``company_id`` is one company or a list of them, searched in one pass;
+    each group keeps the company its move lines belong to, along with its
+    lots, unit price, discount and product ID. The result is empty (and
+    falsy) when no lot was found. ``warn(message)`` receives non-fatal
+    issues (defaults to the module logger); RPC errors propagate to the
+    caller. Synchronous wrapper around ``lookup_lot_numbers_async`` for the
+    Streamlit handlers and the batch CLI.
+    """
+    return run_sync(lookup_lot_numbers_async(lot_numbers, client, company_id, progress=progress, warn=warn))
+
+def update_lookup(previous, lot_numbers, client, company_id, progress=None, warn=None):
+    """Bring an earlier LookupResult in line with a new lot list, querying Odoo only for new lots.
+
+    Lots no longer requested are dropped from their groups (empty groups are
+    removed) and lots not resolved yet are looked up and merged in; the
+    earlier result is left untouched. Returns ``(result, stats)`` with the
+    reused, dropped and looked-up lot counts.
+    """
+    requested = set(lot_numbers)
+    builder = LookupResultBuilder()
+    resolved = set()
+    dropped = set()
+    for group in previous or ():
+        # Summary groups without loaded lots are looked up again
+        if not group.loaded:
+            continue
+        lots = [lot for lot in group.lots if lot in requested]
+        dropped.update(lot for lot in group.lots if lot not in requested)
+        if lots:
+            builder.add_group(group.po_name, group.product_name, group.vendor, lots,
+                              group.unit_price, group.discount, group.product_id, group.company_id)
+            resolved.update(lots)
+
+    new_lots = [lot for lot in dict.fromkeys(lot_numbers) if lot not in resolved]
+    if new_lots:
+        delta = lookup_lot_numbers(new_lots, client, company_id, progress=progress, warn=warn)
+        for group in delta:
+            builder.add_group(group.po_name, group.product_name, group.vendor, group.lots,
+                              group.unit_price, group.discount, group.product_id, group.company_id)
+
+    stats = {'reused': len(resolved), 'dropped': len(dropped), 'looked_up': len(new_lots)}
+    return builder.build(), stats
+
+# === Pipelined Lookup ===
+def run_sync(coroutine):
+    """Run a coroutine to completion from synchronous code, on a worker thread if this thread already runs an event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return submit_traced(executor, asyncio.run, coroutine).result()
+
+class LookupPipeline:
+    """The fetch stages of one lookup as asyncio tasks over the blocking, thread-safe Odoo client.
+
+    Each chunk of move lines starts its picking read and purchase link
+    fetch as soon as it arrives; its product read starts once the links
+    show which moves have none, and its PO line indexes once the pickings
+    give their origins. Every picking, move, product and PO is requested
+    once per run however many chunks reference it. Calls run on a pool of
+    ``workers`` threads, so at most that many are in flight, and no more
+    than ``workers`` move line chunks are pending at a time so the later
+    stages of early chunks are not queued behind every chunk.
+    """
+
+    def __init__(self, client, workers):
+        self.client = client
+        self.workers = max(workers, 1)
+        self._executor = None
+        # Fetch tasks by picking ID, move ID, product ID and PO name
+        self._pickings = {}
+        self._links = {}
+        self._products = {}
+        self._orders = {}
+
+    def _call(self, func, *args):
+        return asyncio.wrap_future(submit_traced(self._executor, func, *args))
+
+    def _fetch_once(self, tasks, keys, fetch):
+        """Start ``fetch(client, new_keys)`` for the keys not requested yet; returns a future of the result dicts covering ``keys``"""
+        keys = set(keys)
+        new_keys = [key for key in keys if key not in tasks]
+        if new_keys:
+            task = self._call(fetch, self.client, new_keys)
+            for key in new_keys:
+                tasks[key] = task
+        return asyncio.gather(*set(tasks[key] for key in keys))
+
+    @staticmethod
+    def _merged(tasks):
+        return {key: value for task in set(tasks.values()) for key, value in task.result().items()}
+
+    @staticmethod
+    def _fetch_orders(client, po_names):
+        po_map, po_indexes = fetch_po_line_indexes(client, po_names)
+        return {name: (po, po_indexes[po['id']]) for name, po in po_map.items()}
+
+    async def _resolve(self, move_lines):
+        """Fetch what one chunk of move lines needs to be traced to PO lines; returns the chunk"""
+        pickings = self._fetch_once(
+            self._pickings, (ml['picking_id'][0] for ml in move_lines if ml['picking_id']), read_pickings)
+        links = {}
+        for result in await self._fetch_once(
+                self._links, (ml['move_id'][0] for ml in move_lines if ml['move_id']), fetch_purchase_links):
+            links.update(result)
+
+        # Fallback data for moves without a purchase link
+        unlinked_lines = unlinked_move_lines(move_lines, links)
+        products = self._fetch_once(
+            self._products, (ml['product_id'][0] for ml in unlinked_lines if ml['product_id']), read_product_names)
+        picking_map = {}
+        for result in await pickings:
+            picking_map.update(result)
+        origins = [picking_map[ml['picking_id'][0]]['origin'] for ml in included_move_lines(unlinked_lines, picking_map)]
+        orders = self._fetch_once(self._orders, (origin for origin in origins if origin), self._fetch_orders)
+
+        await asyncio.gather(products, orders)
+        return move_lines
+
+    async def run(self, lot_numbers, company_ids, progress=None):
+        """Fetch the move lines of ``lot_numbers`` along with everything needed to resolve them; returns the move lines"""
+        lot_numbers = list(dict.fromkeys(lot_numbers))
+        lot_index = get_lot_index()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        stages = []
+        try:
+            indexed_lines, lot_numbers = await self._call(fetch_indexed_move_lines, lot_numbers, self.client, company_ids)
+            if indexed_lines:
+                stages.append(asyncio.ensure_future(self._resolve(indexed_lines)))
+
+            chunk_size = max(CONFIG['lot_chunk_size'], 1)
+            chunks = [lot_numbers[i:i + chunk_size] for i in range(0, len(lot_numbers), chunk_size)]
+            chunk_slots = asyncio.Semaphore(self.workers)
+            done = 0
+
+            async def fetch_chunk(chunk):
+                nonlocal done
+                try:
+                    chunk_lines = await self._call(fetch_move_lines_chunk, self.client, chunk, company_ids)
+                finally:
+                    chunk_slots.release()
+                done += 1
+                if progress:
+                    progress(done, len(chunks))
+                if lot_index:
+                    await asyncio.gather(self._resolve(chunk_lines), self._call(lot_index.upsert, chunk_lines))
+                    return chunk_lines
+                return await self._resolve(chunk_lines)
+
+            for chunk in chunks:
+                await chunk_slots.acquire()
+                # Stop feeding chunks once a stage failed; the gather below raises its error
+                if any(stage.done() and stage.exception() for stage in stages):
+                    break
+                stages.append(asyncio.ensure_future(fetch_chunk(chunk)))
+            if not chunks and progress:
+                progress(1, 1)
+
+            return [ml for chunk_lines in await asyncio.gather(*stages) for ml in chunk_lines]
+        finally:
+            # After a failure, cancel the stages and fetches still running and collect their
+            # errors, then drop queued calls without waiting for the ones in flight
+            tasks = stages + [task for tasks in (self._pickings, self._links, self._products, self._orders)
+                              for task in set(tasks.values())]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def resolve(self, move_lines, warn):
+        """Yield ``resolve_purchase_lines`` tuples for move lines of a finished ``run``"""
+        picking_map = self._merged(self._pickings)
+        orders = self._merged(self._orders)
+        po_map = {name: po for name, (po, index) in orders.items()}
+        po_indexes = {po['id']: index for po, index in orders.values()}
+        yield from match_purchase_lines(
+            included_move_lines(move_lines, picking_map), picking_map, self._merged(self._links),
+            self._merged(self._products), po_map, po_indexes, warn)
+
+async def lookup_lot_numbers_async(lot_numbers, client, company_id, progress=None, warn=None):
+    """``lookup_lot_numbers`` as a coroutine running its fetch stages through a ``LookupPipeline``.
+
+    Wall time follows the slowest chain of dependent calls instead of the
+    sum of all stages. At most ``lookup_workers`` calls are in flight, and
+    ``progress`` is called from the event loop thread as move line chunks
+    arrive.
+    """
+    warn = warn or logger.warning
+    pipeline = LookupPipeline(client, CONFIG['lookup_workers'])
+    move_lines = await pipeline.run(lot_numbers, as_company_ids(company_id), progress)
+
+    if not move_lines:
+        warn("No stock move lines found for the given lot numbers.")
+        return LookupResult()
+
+    builder = LookupResultBuilder()
+    for ml, po_name, line_product, vendor_name, line in pipeline.resolve(move_lines, warn):
+        builder.add_lot(po_name, line_product, vendor_name, ml['lot_name'],
+                        line['price_unit'], line['discount'], ml['product_id'][0] if ml['product_id'] else None,
+                        ml['company_id'][0])
+
+    return builder.build()
+
+# === Summary Lookup ===
+SUMMARY_GROUPBY = ['company_id', 'picking_id', 'product_id', 'move_id']
+
+def fetch_move_line_summary_chunk(client, lot_chunk, company_id):
+    """Count the distinct lots of one chunk per company, picking, product and move with read_group"""
+    return client.execute('stock.move.line', 'read_group',
+        [
+            ['lot_name', 'in', lot_chunk],
+            ['company_id', 'in', as_company_ids(company_id)]
+        ],
+        ['lot_name:count_distinct'], SUMMARY_GROUPBY, lazy=False)
+
+def fetch_move_line_summary(lot_numbers, client, company_id, progress=None):
+    """Aggregate move lines of the lots into rows shaped like move lines, with a ``lot_count`` instead of a lot name.
+
+    Chunks run on a pool of ``lookup_workers`` threads; the same
+    move can appear in several chunks, so rows are merged per move.
+    """
+    lot_numbers = list(dict.fromkeys(lot_numbers))
+    chunk_size = max(CONFIG['lot_chunk_size'], 1)
+    chunks = [lot_numbers[i:i + chunk_size] for i in range(0, len(lot_numbers), chunk_size)]
+
+    rows = {}
+    with ThreadPoolExecutor(max_workers=max(min(CONFIG['lookup_workers'], len(chunks)), 1)) as executor:
+        futures = [submit_traced(executor, fetch_move_line_summary_chunk, client, chunk, company_id) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), start=1):
+            for group in future.result():
+                key = tuple(group[field][0] if group[field] else None for field in SUMMARY_GROUPBY)
+                row = rows.get(key)
+                if row is None:
+                    row = rows[key] = dict({field: group[field] for field in SUMMARY_GROUPBY}, lot_count=0)
+                row['lot_count'] += group['lot_name']
+            if progress:
+                progress(done, len(chunks))
+
+    return list(rows.values())
+
+def summarize_lot_numbers(lot_numbers, client, company_id, progress=None, warn=None):
+    """Resolve lot numbers to a summary LookupResult: lot counts per group, without the lot names.
+
+    Odoo counts the lots with read_group, so only one row per stock move is
+    transferred. Load the lot names of the groups that need them with
+    ``load_group_lots``. When the lot index is built, the full lookup is
+    served locally anyway and is returned instead.
+    """
+    warn = warn or logger.warning
+    lot_index = get_lot_index()
+    if lot_index and all(lot_index.is_built(company) for company in as_company_ids(company_id)):
+        return lookup_lot_numbers(lot_numbers, client, company_id, progress=progress, warn=warn)
+
+    rows = fetch_move_line_summary(lot_numbers, client, company_id, progress)
+    if not rows:
+        warn("No stock move lines found for the given lot numbers.")
+        return LookupResult()
+
+    builder = LookupResultBuilder(lot_numbers=tuple(dict.fromkeys(lot_numbers)))
+    for row, po_name, line_product, vendor_name, line in resolve_purchase_lines(client, rows, warn):
+        builder.add_summary(po_name, line_product, vendor_name, row['lot_count'],
+                            line['price_unit'], line['discount'], row['product_id'][0] if row['product_id'] else None,
+                            row['company_id'][0], [row['move_id'][0]] if row['move_id'] else [])
+
+    return builder.build()
+
+def load_group_lots(client, result, groups):
+    """Return ``result`` with the lot names of the given summary groups loaded.
+
+    Lots are read from the groups' stock moves and kept when they were part
+    of the summarized lot numbers. Already loaded groups cost nothing.
+    """
+    pending = [group for group in groups if not group.loaded]
+    if not pending:
+        return result
+
+    requested = set(result.lot_numbers or ())
+    move_ids = sorted(set(move_id for group in pending for move_id in group.move_ids))
+    chunk_size = max(CONFIG['lot_chunk_size'], 1)
+    lots_by_move = defaultdict(set)
+    for i in range(0, len(move_ids), chunk_size):
+        move_lines = client.search_read('stock.move.line',
+            [['move_id', 'in', move_ids[i:i + chunk_size]], ['lot_name', '!=', False]],
+            ['lot_name', 'move_id'])
+        for ml in move_lines:
+            if ml['lot_name'] in requested:
+                lots_by_move[ml['move_id'][0]].add(ml['lot_name'])
+
+    return result.replace(
+        group.with_lots(set(lot for move_id in group.move_ids for lot in lots_by_move[move_id]))
+        for group in pending)
+
+# === Credit Notes ===
+def find_product_ids(client, product_name, company_id):
+    return get_master_data_cache().get_or_fetch(
+        'product', (product_name, company_id),
+        lambda: client.search('product.product',
+            [['name', 'ilike', product_name], '|', ['company_id', '=', company_id], ['company_id', '=', False]],
+            limit=1))
+
+def resolve_product_ids(client, product_names, company_id):
+    """Map product names to product IDs, fetching all cache misses in one search_read"""
+    master_data = get_master_data_cache()
+    product_ids = {}
+    missing = []
+    for name in set(product_names):
+        cached = master_data.get('product', (name, company_id))
+        if cached:
+            product_ids[name] = cached[0]
+        else:
+            missing.append(name)
+
+    if missing:
+        products = client.search_read('product.product',
+            [['name', 'in', missing], '|', ['company_id', '=', company_id], ['company_id', '=', False]],
+            ['id', 'name'])
+        for product in products:
+            if product['name'] not in product_ids:
+                product_ids[product['name']] = product['id']
+                master_data.set('product', (product['name'], company_id), [product['id']])
+
+        # Names with no exact match fall back to the ilike search
+        for name in missing:
+            if name not in product_ids:
+                ids = find_product_ids(client, name, company_id)
+                if ids:
+                    product_ids[name] = ids[0]
+
+    return product_ids
+
+def resolve_result_product_ids(client, result):
+    """Resolve the product IDs a LookupResult is missing, per company: ``{company_id: {name: product_id}}``"""
+    return {
+        company_id: resolve_product_ids(client, missing_product_names(result.for_company(company_id)), company_id)
+        for company_id in result.companies()
+    }
+
+class CreditNoteError(Exception):
+    """Credit note could not be created for a vendor"""
+
+def resolve_journal_ids(client, company_ids):
+    """Map companies to their 'Vendor Bills' purchase journal, fetching all cache misses in one search_read.
+
+    Companies without such a journal are left out.
+    """
+    master_data = get_master_data_cache()
+    journal_ids = {}
+    missing = []
+    for company_id in set(company_ids):
+        cached = master_data.get('journal', company_id)
+        if cached:
+            journal_ids[company_id] = cached[0]
+        else:
+            missing.append(company_id)
+
+    if missing:
+        journals = client.search_read('account.journal',
+            [['type', '=', 'purchase'], ['name', 'ilike', 'Vendor Bills'], ['company_id', 'in', missing]],
+            ['id', 'company_id'])
+        for journal in journals:
+            company_id = journal['company_id'][0]
+            if company_id not in journal_ids:
+                journal_ids[company_id] = journal['id']
+                master_data.set('journal', company_id, [journal['id']])
+
+    return journal_ids
+
+def resolve_partner_ids(client, vendors):
+    """Map ``(vendor_name, company_id)`` pairs to partner IDs, fetching all cache misses in one search_read.
+
+    A partner matches a company when it belongs to it or is shared between
+    companies; vendors with no exact name match are left out.
+    """
+    master_data = get_master_data_cache()
+    partner_ids = {}
+    missing = set()
+    for vendor in set(vendors):
+        cached = master_data.get('partner', vendor)
+        if cached:
+            partner_ids[vendor] = cached[0]
+        else:
+            missing.add(vendor)
+
+    if missing:
+        company_ids = sorted(set(company_id for _, company_id in missing))
+        partners = client.search_read('res.partner',
+            [['name', 'in', sorted(set(name for name, _ in missing))],
+             '|', ['company_id', 'in', company_ids], ['company_id', '=', False]],
+            ['id', 'name', 'company_id'])
+        for partner in partners:
+            owner = partner['company_id'][0] if partner['company_id'] else None
+            for company_id in company_ids:
+                vendor = (partner['name'], company_id)
+                if vendor in missing and vendor not in partner_ids and owner in (None, company_id):
+                    partner_ids[vendor] = partner['id']
+                    master_data.set('partner', vendor, [partner['id']])
+
+    return partner_ids
+
+def credit_note_vals(partner_id, journal_id, credit_note_date, due_date, reference, line_vals, company_id,
+                     marker=None):
+    vals = {
+        'move_type': 'in_refund',
+        'partner_id': partner_id,
+        'invoice_date': credit_note_date,
+        'invoice_date_due': due_date,
+        'journal_id': journal_id,
+        'ref': reference,
+        'invoice_line_ids': line_vals,
+        'company_id': company_id,
+    }
+    if marker:
+        vals['narration'] = marker
+    return vals
+
+def create_vendor_credit_note(client, vendor_name, credit_note_date, due_date, reference, line_vals, company_id):
+    """Create a vendor credit note and return its ID, raising CreditNoteError on failure"""
+    # Fetch Vendor (Partner) ID
+    master_data = get_master_data_cache()
+    vendor_ids = master_data.get_or_fetch(
+        'partner', (vendor_name, company_id),
+        lambda: client.search('res.partner',
+            [['name', '=', vendor_name], '|', ['company_id', '=', company_id], ['company_id', '=', False]],
+            limit=1))
+    if not vendor_ids:
+        raise CreditNoteError(f"Vendor '{vendor_name}' not found in company '{get_company_name(company_id)}'.")
+
+    # Fetch Journal ID (Vendor Bills / Purchase type)
+    journal_id = resolve_journal_ids(client, [company_id]).get(company_id)
+    if not journal_id:
+        raise CreditNoteError(f"'Vendor Bills' journal not found for company '{get_company_name(company_id)}'.")
+
+    # Create Vendor Credit Note
+    try:
+        return client.create('account.move', credit_note_vals(
+            vendor_ids[0], journal_id, credit_note_date, due_date, reference, line_vals, company_id))
+    except Exception as e:
+        raise CreditNoteError(f"Error creating credit note: {str(e)}") from e
+
+def build_credit_note_lines(groups, product_ids):
+    """Build account.move line commands for lookup groups (normally one vendor's)"""
+    line_vals = []
+    for group in groups:
+        if not group.lots:
+            continue
+
+        product_id = group.product_id or product_ids.get(group.product_name)
+
+        if product_id:
+            line_vals.append((0, 0, {
+                'product_id': product_id,
+                'quantity': len(group.lots),
+                'price_unit': group.unit_price,
+                'discount': group.discount,
+                'name': f"Damage - Lots: {', '.join(group.lots[:3])}" + ("..." if len(group.lots) > 3 else ""),
+            }))
+    return line_vals
+
+def missing_product_names(result):
+    """Product names of groups whose product ID was not carried over from the lookup"""
+    return [group.product_name for group in result if not group.product_id]
+
+def credit_note_failure(error):
+    """Outcome and message of a failed credit note create.
+
+    A call that may have been applied (timeout, gateway error) has an
+    'unknown' outcome and must not be resent before Odoo is checked; an
+    overloaded server gives a 'retryable' one; anything else 'failed'.
+    """
+    kind = classify_error(error)
+    if kind == 'idempotent':
+        return 'unknown', f"Credit note creation outcome unknown, check Odoo before rerunning: {str(error)}"
+    if kind == 'safe':
+        return 'retryable', f"Odoo is overloaded, rerun to retry: {str(error)}"
+    return 'failed', f"Error creating credit note: {str(error)}"
+
+def create_credit_note_batch(client, batch):
+    """Create a batch of ``(result, vals)`` credit notes in one call and fill in each result.
+
+    When Odoo rejects the batch, nothing was created and each credit note
+    is retried on its own, so one bad vendor does not fail the others. A
+    transient failure (overload, timeout) is not retried here: the call
+    already went through the retry policy, so every vendor of the batch
+    gets the same ``credit_note_failure`` outcome instead.
+    """
+    try:
+        move_ids = client.create('account.move', [vals for _, vals in batch])
+    except Exception as e:
+        if classify_error(e) is not None:
+            outcome, message = credit_note_failure(e)
+            for result, _ in batch:
+                result['outcome'], result['error'] = outcome, message
+            return [result for result, _ in batch]
+
+        logger.warning("Batch of %d credit notes failed, creating them one by one: %s", len(batch), e)
+        for result, vals in batch:
+            try:
+                result['credit_note_id'] = client.create('account.move', vals)
+                result['outcome'] = 'created'
+            except Exception as error:
+                result['outcome'], result['error'] = credit_note_failure(error)
+        return [result for result, _ in batch]
+
+    for (result, _), move_id in zip(batch, move_ids):
+        result['credit_note_id'] = move_id
+        result['outcome'] = 'created'
+    return [result for result, _ in batch]
+
+def create_vendor_credits(client, result, product_ids, credit_note_date, due_date, reference, marker=None):
+    """Create credit notes for every company and vendor of a LookupResult, yielding each result as it finishes.
+
+    Each credit note goes to the company the vendor's lots were found in,
+    using that company's product IDs (``{company_id: {name: product_id}}``).
+    Partners and journals of all companies are resolved up front in one
+    search_read each, then the moves are created CREDIT_NOTE_BATCH_SIZE at a
+    time, with batches running concurrently. A failing vendor only produces
+    an error result; the others carry on. Each result's ``outcome`` is
+    'created', 'failed', 'retryable' or 'unknown' (see ``credit_note_failure``).
+    ``marker`` is written to each credit note's narration so the ones a
+    run created can be found again (see ``find_run_credit_notes``).
+    """
+    companies = result.companies()
+    if not companies:
+        return
+    journal_ids = resolve_journal_ids(client, companies)
+    partner_ids = resolve_partner_ids(client, [
+        (vendor_name, company_id) for company_id in companies for vendor_name in result.for_company(company_id).vendors()
+    ])
+
+    batch = []
+    for company_id in companies:
+        company_result = result.for_company(company_id)
+        for vendor_name in company_result.vendors():
+            vendor_result = {'vendor': vendor_name, 'company_id': company_id, 'company': get_company_name(company_id),
+                             'credit_note_id': None, 'line_count': 0, 'error': None, 'outcome': 'failed'}
+            line_vals = build_credit_note_lines(company_result.for_vendor(vendor_name), product_ids.get(company_id, {}))
+            vendor_result['line_count'] = len(line_vals)
+            partner_id = partner_ids.get((vendor_name, company_id))
+            if not line_vals:
+                vendor_result['error'] = "No valid products found to create credit note."
+            elif not partner_id:
+                vendor_result['error'] = f"Vendor '{vendor_name}' not found in company '{get_company_name(company_id)}'."
+            elif not journal_ids.get(company_id):
+                vendor_result['error'] = f"'Vendor Bills' journal not found for company '{get_company_name(company_id)}'."
+            else:
+                batch.append((vendor_result, credit_note_vals(
+                    partner_id, journal_ids[company_id], credit_note_date, due_date, reference, line_vals, company_id,
+                    marker)))
+                continue
+            yield vendor_result
+
+    batch_size = max(CONFIG['credit_note_batch_size'], 1)
+    batches = [batch[i:i + batch_size] for i in range(0, len(batch), batch_size)]
+    if not batches:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(min(CONFIG['vendor_workers'], len(batches)), 1)) as executor:
+        futures = [submit_traced(executor, create_credit_note_batch, client, batch) for batch in batches]
+        for future in as_completed(futures):
+            yield from future.result()
+
+def find_run_credit_notes(client, marker, vendors):
+    """Map ``(vendor_name, company_id)`` pairs to the credit note created for them with ``marker``, in one search_read"""
+    partner_ids = resolve_partner_ids(client, vendors)
+    if not partner_ids:
+        return {}
+    vendor_by_partner = {(partner_id, vendor[1]): vendor for vendor, partner_id in partner_ids.items()}
+    moves = client.search_read('account.move',
+        [['move_type', '=', 'in_refund'], ['narration', 'ilike', marker],
+         ['partner_id', 'in', sorted(set(partner_ids.values()))],
+         ['company_id', 'in', sorted(set(company_id for _, company_id in partner_ids))]],
+        ['partner_id', 'company_id'])
+
+    found = {}
+    for move in moves:
+        vendor = vendor_by_partner.get((move['partner_id'][0], move['company_id'][0]))
+        if vendor:
+            found.setdefault(vendor, move['id'])
+    return found
+
+# === Checkpointed Bulk Runs ===
+_checkpoint_journal = None
+_checkpoint_journal_lock = threading.Lock()
+
+def get_checkpoint_journal():
+    global _checkpoint_journal
+    with _checkpoint_journal_lock:
+        if _checkpoint_journal is None:
+            _checkpoint_journal = CheckpointJournal(CONFIG['checkpoint_dir'])
+        return _checkpoint_journal
+
+def bulk_run_key(file_contents, credit_note_date, due_date, reference, company_id):
+    """Return ``(key, params)`` identifying a bulk run of these files with these parameters"""
+    params = {
+        'db': CONFIG['db'],
+        'company_ids': as_company_ids(company_id),
+        'credit_note_date': credit_note_date,
+        'due_date': due_date,
+        'reference': reference,
+    }
+    return run_key(file_contents, params), params
+
+def plan_bulk_run(key, params, lot_numbers, client, company_id, progress=None, warn=None):
+    """Return ``(result, product_ids, resumed)`` for a bulk run.
+
+    A checkpointed plan is reused as is, skipping the lookup; otherwise the
+    lots are looked up, product IDs resolved and the plan checkpointed.
+    Callers hold ``get_checkpoint_journal().lock_run(key)`` around this and
+    ``run_bulk_credits`` so two runs of one key never create credit notes twice.
+    """
+    journal = get_checkpoint_journal()
+    plan = journal.load_plan(key)
+    if plan:
+        return plan[0], plan[1], True
+
+    result = lookup_lot_numbers(lot_numbers, client, company_id, progress=progress, warn=warn)
+    if not result:
+        return result, {}, False
+
+    product_ids = resolve_result_product_ids(client, result)
+    journal.save_plan(key, params, result, product_ids)
+    return result, product_ids, False
+
+def bulk_run_marker(key):
+    """Text written to the credit notes of a bulk run so they can be found after an unknown outcome"""
+    return f"Bulk credit note run {key[:16]}"
+
+def run_bulk_credits(key, client, lookup_result, product_ids, credit_note_date, due_date, reference):
+    """Create credit notes for the company vendors the checkpoint has none for, recording each result as it finishes.
+
+    Vendors whose create had an unknown outcome are first looked up in
+    Odoo by the run's marker: a credit note found there is recorded as
+    created, and only vendors confirmed to have none are created again.
+    When that check fails they are skipped, never resent blindly.
+    """
+    journal = get_checkpoint_journal()
+    skipped = set((result['company_id'], result['vendor']) for result in journal.completed_results(key))
+
+    unknown = journal.unknown_results(key)
+    if unknown:
+        try:
+            found = find_run_credit_notes(
+                client, bulk_run_marker(key), [(result['vendor'], result['company_id']) for result in unknown])
+        except Exception as e:
+            logger.warning("Could not check Odoo for credit notes with an unknown outcome: %s", e)
+            for result in unknown:
+                skipped.add((result['company_id'], result['vendor']))
+                yield dict(result, error=f"Credit note creation outcome unknown and Odoo could not be checked, "
+                                         f"not resending: {str(e)}")
+        else:
+            for result in unknown:
+                credit_note_id = found.get((result['vendor'], result['company_id']))
+                if credit_note_id:
+                    result = dict(result, credit_note_id=credit_note_id, outcome='created', error=None)
+                    journal.record_vendor(key, result)
+                    skipped.add((result['company_id'], result['vendor']))
+                    yield result
+
+    pending = lookup_result.filter(lambda group: (group.company_id, group.vendor) not in skipped)
+    for result in create_vendor_credits(
+            client, pending, product_ids, credit_note_date, due_date, reference, bulk_run_marker(key)):
+        journal.record_vendor(key, result)
+        yield result
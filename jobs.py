@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """State of one background job, updated by its worker and polled by the UI"""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = 'queued'
+        self.progress = (0, 0)
+        self.message = ''
+        self.warnings = []
+        self.partial_results = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def set_progress(self, done, total, message=''):
+        with self._lock:
+            self.progress = (done, total)
+            self.message = message
+
+    def warn(self, message):
+        with self._lock:
+            self.warnings.append(message)
+
+    def add_partial_result(self, item):
+        with self._lock:
+            self.partial_results.append(item)
+
+    def snapshot(self):
+        """Return a consistent copy of the job state for rendering"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'progress': self.progress,
+                'message': self.message,
+                'warnings': list(self.warnings),
+                'partial_results': list(self.partial_results),
+                'result': self.result,
+                'error': self.error,
+            }
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps finished jobs for ``retention`` seconds.
+
+    Jobs outlive the Streamlit session that submitted them, so a rerun or a
+    page reload can look a job up by ID and pick up its progress or result.
+    """
+
+    def __init__(self, max_workers=4, retention=6 * 3600):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Run ``func(job, *args, **kwargs)`` in the background; its return value becomes ``job.result``"""
+        job = Job(kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = 'running'
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = 'done'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
@@ -0,0 +1,208 @@
+import sys
+
+
+class LotGroup:
+    """Lots of one (PO, product, vendor, company) with the PO line price, as a sorted tuple of interned lot names.
+
+    Groups of a summary lookup only know their lot count and the stock
+    moves the lots were received in; ``lots`` is None until they are loaded.
+    """
+
+    __slots__ = ('po_name', 'product_name', 'vendor', 'lots', 'unit_price', 'discount', 'product_id', 'company_id',
+                 'count', 'move_ids')
+
+    def __init__(self, po_name, product_name, vendor, lots, unit_price=0.0, discount=0.0, product_id=None,
+                 company_id=None, count=0, move_ids=()):
+        self.po_name = po_name
+        self.product_name = product_name
+        self.vendor = vendor
+        self.lots = lots
+        self.unit_price = unit_price
+        self.discount = discount
+        self.product_id = product_id
+        self.company_id = company_id
+        self.count = count
+        self.move_ids = move_ids
+
+    @property
+    def key(self):
+        return (self.po_name, self.product_name, self.vendor, self.company_id)
+
+    @property
+    def loaded(self):
+        return self.lots is not None
+
+    @property
+    def lot_count(self):
+        return len(self.lots) if self.lots is not None else self.count
+
+    @property
+    def line_total(self):
+        return self.unit_price * self.lot_count * (1 - self.discount / 100)
+
+    def with_lots(self, lots):
+        """A loaded copy of this group holding ``lots``"""
+        return LotGroup(self.po_name, self.product_name, self.vendor, tuple(sorted(sys.intern(lot) for lot in lots)),
+                        self.unit_price, self.discount, self.product_id, self.company_id)
+
+    def to_record(self):
+        return {
+            'po_name': self.po_name,
+            'product_name': self.product_name,
+            'vendor': self.vendor,
+            'product_id': self.product_id,
+            'company_id': self.company_id,
+            'unit_price': self.unit_price,
+            'discount': self.discount,
+            'lot_count': self.lot_count,
+            'lots': list(self.lots) if self.lots is not None else None,
+            'move_ids': list(self.move_ids),
+        }
+
+
+class LookupResult:
+    """Immutable lookup result: lot groups in lookup order, addressable by key, vendor and company.
+
+    Names are interned so the thousands of groups sharing a PO, product or
+    vendor hold one copy of each string, and lots are stored once per group
+    as tuples rather than sets. Vendor and company views and filters share
+    the group objects instead of copying them. Plain slotted objects keep
+    results picklable for external session stores; ``to_records``/
+    ``from_records`` give a JSON-friendly form. A summary result also keeps
+    the requested ``lot_numbers`` so its groups' lots can be loaded later.
+    """
+
+    __slots__ = ('groups', 'lot_numbers', '_by_key', '_by_vendor', '_by_company')
+
+    def __init__(self, groups=(), lot_numbers=None):
+        self.groups = tuple(groups)
+        self.lot_numbers = lot_numbers
+        self._by_key = {group.key: group for group in self.groups}
+        self._by_vendor = None
+        self._by_company = None
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def __getstate__(self):
+        return self.groups, self.lot_numbers
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def vendors(self):
+        return sorted(self._vendor_groups())
+
+    def _vendor_groups(self):
+        if self._by_vendor is None:
+            by_vendor = {}
+            for group in self.groups:
+                by_vendor.setdefault(group.vendor, []).append(group)
+            self._by_vendor = {vendor: tuple(groups) for vendor, groups in by_vendor.items()}
+        return self._by_vendor
+
+    def for_vendor(self, vendor):
+        """Groups of one vendor, sharing the group objects of this result"""
+        return self._vendor_groups().get(vendor, ())
+
+    def companies(self):
+        return list(self._company_results())
+
+    def _company_results(self):
+        if self._by_company is None:
+            by_company = {}
+            for group in self.groups:
+                by_company.setdefault(group.company_id, []).append(group)
+            self._by_company = {company_id: LookupResult(groups) for company_id, groups in by_company.items()}
+        return self._by_company
+
+    def for_company(self, company_id):
+        """The part of this result found in one company, as a LookupResult sharing the group objects"""
+        return self._company_results().get(company_id) or LookupResult()
+
+    def filter(self, predicate):
+        return LookupResult((group for group in self.groups if predicate(group)), self.lot_numbers)
+
+    def replace(self, groups):
+        """A copy of this result with the groups of the same keys swapped for ``groups``"""
+        replacements = {group.key: group for group in groups}
+        return LookupResult((replacements.get(group.key, group) for group in self.groups), self.lot_numbers)
+
+    def is_loaded(self):
+        return all(group.loaded for group in self.groups)
+
+    def lots(self):
+        return set(lot for group in self.groups if group.loaded for lot in group.lots)
+
+    def lot_count(self):
+        return sum(group.lot_count for group in self.groups)
+
+    def to_records(self):
+        return [group.to_record() for group in self.groups]
+
+    @classmethod
+    def from_records(cls, records):
+        """Rebuild a result from ``to_records`` output"""
+        builder = LookupResultBuilder()
+        for record in records:
+            if record['lots'] is None:
+                builder.add_summary(record['po_name'], record['product_name'], record['vendor'], record['lot_count'],
+                                    record['unit_price'], record['discount'], record['product_id'],
+                                    record['company_id'], record['move_ids'])
+            else:
+                builder.add_group(record['po_name'], record['product_name'], record['vendor'], record['lots'],
+                                  record['unit_price'], record['discount'], record['product_id'],
+                                  record['company_id'])
+        return builder.build()
+
+
+class LookupResultBuilder:
+    """Accumulates lots (or lot counts, for summaries) per group key while a lookup runs, then freezes them into a LookupResult"""
+
+    def __init__(self, lot_numbers=None):
+        self.lot_numbers = lot_numbers
+        self._groups = {}
+
+    def _group(self, po_name, product_name, vendor, unit_price, discount, product_id, company_id):
+        key = (po_name, product_name, vendor, company_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {'lots': set(), 'count': 0, 'move_ids': set(), 'product_id': None}
+        group['unit_price'] = unit_price
+        group['discount'] = discount
+        group['product_id'] = group['product_id'] or product_id
+        return group
+
+    def add_group(self, po_name, product_name, vendor, lots, unit_price, discount, product_id=None, company_id=None):
+        """Merge lots into a group; the latest price wins and the first known product ID is kept"""
+        self._group(po_name, product_name, vendor, unit_price, discount, product_id, company_id)['lots'].update(lots)
+
+    def add_lot(self, po_name, product_name, vendor, lot, unit_price, discount, product_id=None, company_id=None):
+        self.add_group(po_name, product_name, vendor, (lot,), unit_price, discount, product_id, company_id)
+
+    def add_summary(self, po_name, product_name, vendor, count, unit_price, discount, product_id=None,
+                    company_id=None, move_ids=()):
+        """Add a lot count, and the stock moves holding those lots, to a summary group"""
+        group = self._group(po_name, product_name, vendor, unit_price, discount, product_id, company_id)
+        group['count'] += count
+        group['move_ids'].update(move_ids)
+
+    def build(self):
+        intern = sys.intern
+        return LookupResult((
+            LotGroup(intern(po_name or ''), intern(product_name or ''), intern(vendor or ''),
+                     tuple(sorted(intern(lot) for lot in data['lots'])) if data['lots'] else None,
+                     data['unit_price'], data['discount'], data['product_id'], company_id,
+                     data['count'], tuple(sorted(data['move_ids'])))
+            for (po_name, product_name, vendor, company_id), data in self._groups.items()
+            if data['lots'] or data['count']
+        ), self.lot_numbers)
@@ -0,0 +1,237 @@
+import csv
+import io
+import os
+import zipfile
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from collections import Counter
+
+import pandas as pd
+
+
+SPREADSHEET_NAMESPACES = (
+    'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'http://purl.oclc.org/ooxml/spreadsheetml/main',
+)
+
+def _tags(local_name):
+    """Expat names of a SpreadsheetML element, with and without namespace"""
+    return {local_name} | {f"{namespace} {local_name}" for namespace in SPREADSHEET_NAMESPACES}
+
+ROW_TAGS = _tags('row')
+CELL_TAGS = _tags('c')
+TEXT_TAGS = _tags('v') | _tags('t')
+SHARED_STRING_TAGS = _tags('si')
+PHONETIC_TAGS = _tags('rPh')
+
+
+def normalize_lot_number(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip().upper()
+
+def _column_number(reference):
+    number = 0
+    for char in reference.rstrip('0123456789'):
+        number = number * 26 + ord(char.upper()) - 64
+    return number
+
+def _first_sheet_path(archive):
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find('{*}sheets/{*}sheet')
+    relation_id = next(value for key, value in sheet.attrib.items() if key.endswith('}id'))
+
+    relations = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations.findall('{*}Relationship'):
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    raise ValueError("First worksheet not found in workbook")
+
+def _scan_column_a(stream):
+    """Return one ``(cell_type, raw_text)`` per sheet row, or None for blank rows.
+
+    Uses expat callbacks and only buffers text of column A cells, so the
+    other columns are skipped without building any cell objects.
+    """
+    cells = []
+    row_number = 0
+    column = 0
+    row_has_value = False
+    in_cell = False
+    in_text = False
+    cell_type = None
+    buffer = []
+
+    def start(name, attrs):
+        nonlocal row_number, column, row_has_value, in_cell, in_text, cell_type, buffer
+        if name in CELL_TAGS:
+            reference = attrs.get('r')
+            if not reference:
+                column += 1
+            elif reference[0] == 'A' and reference[1].isdigit():
+                column = 1
+            else:
+                column = _column_number(reference)
+            if column == 1:
+                in_cell = True
+                cell_type = attrs.get('t', 'n')
+                buffer = []
+        elif in_cell and name in TEXT_TAGS:
+            in_text = True
+        elif name in ROW_TAGS:
+            reference = attrs.get('r')
+            number = int(reference) if reference else row_number + 1
+            # Rows missing from the sheet XML are blank rows
+            cells.extend([None] * (number - row_number - 1))
+            row_number = number
+            column = 0
+            row_has_value = False
+
+    def end(name):
+        nonlocal row_has_value, in_cell, in_text
+        if in_text and name in TEXT_TAGS:
+            in_text = False
+        elif in_cell and name in CELL_TAGS:
+            in_cell = False
+            row_has_value = True
+            cells.append((cell_type, ''.join(buffer)))
+        elif name in ROW_TAGS and not row_has_value:
+            cells.append(None)
+
+    def data(text):
+        if in_text:
+            buffer.append(text)
+
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.ParseFile(stream)
+    return cells
+
+def _read_shared_strings(stream, indexes):
+    """Return ``{index: text}`` for the requested shared string indexes only"""
+    strings = {}
+    position = -1
+    in_phonetic = False
+    in_text = False
+    buffer = []
+
+    def start(name, attrs):
+        nonlocal position, in_phonetic, in_text, buffer
+        if name in SHARED_STRING_TAGS:
+            position += 1
+            buffer = []
+        elif name in PHONETIC_TAGS:
+            in_phonetic = True
+        elif name in TEXT_TAGS and not in_phonetic and position in indexes:
+            in_text = True
+
+    def end(name):
+        nonlocal in_phonetic, in_text
+        if name in TEXT_TAGS:
+            in_text = False
+        elif name in PHONETIC_TAGS:
+            in_phonetic = False
+        elif name in SHARED_STRING_TAGS and position in indexes:
+            strings[position] = ''.join(buffer)
+
+    def data(text):
+        if in_text:
+            buffer.append(text)
+
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    parser.ParseFile(stream)
+    return strings
+
+def _iter_xlsx_column_a(file):
+    with zipfile.ZipFile(file) as archive:
+        with archive.open(_first_sheet_path(archive)) as stream:
+            cells = _scan_column_a(stream)
+
+        indexes = {int(cell[1]) for cell in cells if cell and cell[0] == 's'}
+        shared_strings = {}
+        if indexes and 'xl/sharedStrings.xml' in archive.namelist():
+            with archive.open('xl/sharedStrings.xml') as stream:
+                shared_strings = _read_shared_strings(stream, indexes)
+
+    for cell in cells:
+        if cell is None:
+            yield None
+            continue
+        cell_type, raw = cell
+        if cell_type == 's':
+            yield shared_strings.get(int(raw))
+        elif cell_type == 'n' and raw:
+            yield float(raw)
+        elif cell_type == 'e':
+            yield None
+        else:
+            yield raw
+
+def iter_column_a(file, filename):
+    """Yield the column A value of every row of a lot file.
+
+    .xlsx files are streamed straight from the sheet XML, buffering only
+    column A, and .csv files with the csv module. Legacy .xls files go
+    through pandas, restricted to the first column.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension == '.csv':
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        try:
+            for row in csv.reader(text):
+                yield row[0] if row else None
+        finally:
+            text.detach()
+    elif extension == '.xls':
+        df = pd.read_excel(file, header=None, usecols=[0], dtype=str)
+        for value in df.iloc[:, 0]:
+            yield None if pd.isna(value) else value
+    else:
+        yield from _iter_xlsx_column_a(file)
+
+def read_lot_numbers(file, filename, skip_header=True):
+    """Read, normalize and deduplicate the lot numbers in column A of a lot file.
+
+    Returns ``(lot_numbers, report)`` where ``lot_numbers`` keeps first-seen
+    order and ``report`` holds the row, blank-row and duplicate counts plus
+    the number of extra occurrences of each duplicated lot.
+    """
+    seen = set()
+    lot_numbers = []
+    duplicates = Counter()
+    rows = blank_rows = 0
+
+    values = iter_column_a(file, filename)
+    if skip_header:
+        next(values, None)
+
+    for value in values:
+        rows += 1
+        lot = normalize_lot_number(value)
+        if not lot:
+            blank_rows += 1
+        elif lot in seen:
+            duplicates[lot] += 1
+        else:
+            seen.add(lot)
+            lot_numbers.append(lot)
+
+    report = {
+        'rows': rows,
+        'unique': len(lot_numbers),
+        'blank_rows': blank_rows,
+        'duplicate_rows': sum(duplicates.values()),
+        'duplicates': dict(duplicates),
+    }
+    return lot_numbers, report
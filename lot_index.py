@@ -0,0 +1,188 @@
+"""Local SQLite index of stock move lines by lot number.
+
+Mirrors the ``stock.move.line`` fields the lot lookup needs, kept fresh by
+incremental syncs on ``write_date``. Build or refresh it from the shell:
+
+    python -m lot_index sync          # incremental, or backfill when empty
+    python -m lot_index sync --full   # drop and rebuild (removes deleted lines)
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+
+from sqlite_mirror import SQLiteMirror, chunks, many2one, split_many2one
+
+logger = logging.getLogger(__name__)
+
+MOVE_LINE_FIELDS = ['lot_name', 'picking_id', 'product_id', 'move_id', 'write_date']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS move_lines (
+    id INTEGER PRIMARY KEY,
+    company_id INTEGER NOT NULL,
+    lot_name TEXT NOT NULL,
+    picking_id INTEGER,
+    picking_name TEXT,
+    product_id INTEGER,
+    product_name TEXT,
+    move_id INTEGER,
+    move_name TEXT,
+    write_date TEXT
+);
+CREATE INDEX IF NOT EXISTS move_lines_lot ON move_lines (company_id, lot_name);
+"""
+
+
+def _row(move_line, company_id):
+    if company_id is None:
+        company_id = move_line['company_id'][0]
+    return (move_line['id'], company_id, move_line['lot_name'],
+            *split_many2one(move_line, 'picking_id'), *split_many2one(move_line, 'product_id'),
+            *split_many2one(move_line, 'move_id'), move_line.get('write_date'))
+
+
+class LotIndex(SQLiteMirror):
+    """SQLite mirror of the looked-up companies' stock move lines, keyed by move line ID and searchable by lot name.
+
+    Lookups return records shaped like ``search_read`` results, so callers
+    can mix index hits with lines fetched live from Odoo. Hits are as fresh
+    as the last sync; lines deleted in Odoo stay until a full resync.
+    """
+
+    def __init__(self, path, sync_batch_size=5000):
+        super().__init__(path, SCHEMA)
+        self.sync_batch_size = sync_batch_size
+        self._sync_lock = threading.Lock()
+
+    def is_built(self, company_id):
+        """Whether the index has been synced at least once for the company"""
+        return self._sync_state(company_id) is not None
+
+    def lookup(self, lot_names, company_ids):
+        """Return ``(move_lines, missing_lot_names)`` for the given lots in one or more companies"""
+        company_ids = list(company_ids) if isinstance(company_ids, (list, tuple)) else [company_ids]
+        lot_names = list(dict.fromkeys(lot_names))
+        move_lines = []
+        with self._lock:
+            for chunk in chunks(lot_names):
+                rows = self._conn.execute(
+                    "SELECT id, lot_name, picking_id, picking_name, product_id, product_name, "
+                    "move_id, move_name, write_date, company_id FROM move_lines "
+                    f"WHERE company_id IN ({','.join('?' * len(company_ids))}) "
+                    f"AND lot_name IN ({','.join('?' * len(chunk))})",
+                    (*company_ids, *chunk)).fetchall()
+                move_lines.extend({
+                    'id': row[0],
+                    'lot_name': row[1],
+                    'picking_id': many2one(row[2], row[3]),
+                    'product_id': many2one(row[4], row[5]),
+                    'move_id': many2one(row[6], row[7]),
+                    'write_date': row[8],
+                    'company_id': many2one(row[9], ''),
+                } for row in rows)
+
+        found = set(ml['lot_name'] for ml in move_lines)
+        return move_lines, [lot for lot in lot_names if lot not in found]
+
+    def upsert(self, move_lines, company_id=None):
+        """Store move lines read from Odoo (must include ``write_date``, and ``company_id`` when no company is given)"""
+        rows = [_row(ml, company_id) for ml in move_lines if ml.get('lot_name')]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO move_lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def clear(self, company_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM move_lines WHERE company_id = ?", (company_id,))
+            self._conn.execute("DELETE FROM sync_state WHERE scope = ?", (company_id,))
+
+    def sync(self, client, company_id, max_age=0, full=False):
+        """Pull move lines written since the last sync; returns the number of lines stored.
+
+        Skipped when the last sync is younger than ``max_age`` seconds.
+        Lines written in the watermark second itself are re-read, which is
+        harmless because rows are upserted by ID. Pages follow a
+        ``(write_date, id)`` cursor rather than an offset, so a line written
+        during the sync moves past the cursor instead of shifting the later
+        pages and making one line be skipped.
+        """
+        with self._sync_lock:
+            if full:
+                self.clear(company_id)
+            state = self._sync_state(company_id)
+            if state and time.time() - state[1] < max_age:
+                return 0
+
+            watermark = state[0] if state else None
+            base_domain = [['company_id', '=', company_id], ['lot_name', '!=', False]]
+            domain = base_domain + ([['write_date', '>=', watermark]] if watermark else [])
+
+            stored = 0
+            while True:
+                batch = client.search_read(
+                    'stock.move.line', domain, MOVE_LINE_FIELDS,
+                    order='write_date asc, id asc', limit=self.sync_batch_size)
+                self.upsert(batch, company_id)
+                stored += len(batch)
+                if not batch:
+                    break
+                last = batch[-1]
+                watermark = max(watermark or '', last['write_date'])
+                if len(batch) < self.sync_batch_size:
+                    break
+                domain = base_domain + [
+                    '|', ['write_date', '>', last['write_date']],
+                    '&', ['write_date', '=', last['write_date']], ['id', '>', last['id']],
+                ]
+
+            self._set_sync_state(company_id, watermark, time.time())
+            logger.info("Lot index synced %d move lines for company %s (watermark %s)",
+                        stored, company_id, watermark)
+            return stored
+
+    def stats(self):
+        """Return move line and lot counts plus the sync state of each company"""
+        with self._lock:
+            move_lines, lots = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT lot_name) FROM move_lines").fetchone()
+            companies = self._conn.execute(
+                "SELECT scope, watermark, synced_at FROM sync_state").fetchall()
+        return {
+            'move_lines': move_lines,
+            'lots': lots,
+            'companies': {
+                company_id: {'watermark': watermark, 'synced_at': synced_at}
+                for company_id, watermark, synced_at in companies
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the local SQLite lot index.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    sync_parser = subparsers.add_parser('sync', help="pull new and changed move lines from Odoo")
+    sync_parser.add_argument('--full', action='store_true', help="drop the index and rebuild it")
+    subparsers.add_parser('stats', help="show index size and last sync")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stderr)
+
+    import engine
+    lot_index = engine.get_lot_index()
+    if not lot_index:
+        parser.error("LOT_INDEX_PATH is not set")
+
+    client = engine.create_odoo_client()
+    if args.command == 'sync':
+        for company_id in engine.get_company_ids(client):
+            lot_index.sync(client, company_id, full=args.full)
+    print(lot_index.stats())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
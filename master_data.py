@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class MasterDataCache:
+    """Thread-safe TTL/LRU cache for Odoo reference data.
+
+    Entries are grouped by entity ('company', 'journal', 'partner', ...),
+    each with its own time-to-live, and the least recently used entries
+    are evicted once an entity holds more than ``max_entries`` keys.
+    Empty results are never cached, so records created after a miss are
+    picked up on the next lookup.
+    """
+
+    def __init__(self, ttls, default_ttl=3600, max_entries=2048):
+        self.ttls = dict(ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entity(self, entity):
+        if entity not in self._entries:
+            self._entries[entity] = OrderedDict()
+            self._stats[entity] = {'hits': 0, 'misses': 0}
+        return self._entries[entity]
+
+    def get(self, entity, key):
+        """Return the cached value for ``key``, or None when missing or expired"""
+        with self._lock:
+            entries = self._entity(entity)
+            entry = entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                entries.move_to_end(key)
+                self._stats[entity]['hits'] += 1
+                return entry[1]
+            self._stats[entity]['misses'] += 1
+            return None
+
+    def get_or_fetch(self, entity, key, fetch):
+        """Return the cached value for ``key`` or call ``fetch()`` and cache its result"""
+        value = self.get(entity, key)
+        if value:
+            return value
+
+        value = fetch()
+        if value:
+            self.set(entity, key, value)
+        return value
+
+    def set(self, entity, key, value):
+        expires_at = time.monotonic() + self.ttls.get(entity, self.default_ttl)
+        with self._lock:
+            entries = self._entity(entity)
+            entries[key] = (expires_at, value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self, entity=None):
+        with self._lock:
+            if entity is None:
+                for entries in self._entries.values():
+                    entries.clear()
+            elif entity in self._entries:
+                self._entries[entity].clear()
+
+    def stats(self):
+        """Return ``{entity: {'hits', 'misses', 'size'}}``"""
+        with self._lock:
+            return {
+                entity: dict(self._stats[entity], size=len(entries))
+                for entity, entries in self._entries.items()
+            }
@@ -0,0 +1,216 @@
+import http.client
+import itertools
+import queue
+import xmlrpc.client
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rpc_control import CallPolicy
+from rpc_trace import note_bytes, result_count, traced_call
+
+
+class OdooError(Exception):
+    """Error reported by the Odoo server for an RPC call"""
+
+
+# === XML-RPC Transport ===
+class PooledTransport(xmlrpc.client.Transport):
+    """XML-RPC transport backed by a fixed pool of keep-alive connections.
+
+    The stock transport holds a single connection and is not safe to share
+    between threads. Here every request checks a connection out of the pool,
+    blocking while all of them are busy, and returns it once the response
+    has been read, so one ServerProxy can serve every session and worker.
+    Connections give up after ``timeout`` seconds without a response.
+    """
+
+    def __init__(self, pool_size=8, use_https=False, timeout=None):
+        super().__init__()
+        self._use_https = use_https
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        for _ in range(max(pool_size, 1)):
+            self._pool.put(None)
+
+    def _new_connection(self, host):
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        if self._use_https:
+            return http.client.HTTPSConnection(chost, timeout=self.timeout, **(x509 or {}))
+        return http.client.HTTPConnection(chost, timeout=self.timeout)
+
+    def _send(self, connection, host, handler, request_body):
+        headers = self._headers + self._extra_headers + [
+            ("Accept-Encoding", "gzip"),
+            ("Content-Type", "text/xml"),
+            ("User-Agent", self.user_agent),
+        ]
+        connection.putrequest("POST", handler, skip_accept_encoding=True)
+        self.send_headers(connection, headers)
+        self.send_content(connection, request_body)
+
+        response = connection.getresponse()
+        note_bytes(len(request_body), int(response.getheader('Content-Length') or 0))
+        if response.status == 200:
+            return self.parse_response(response)
+
+        response.read()
+        raise xmlrpc.client.ProtocolError(
+            host + handler, response.status, response.reason, dict(response.getheaders()))
+
+    def request(self, host, handler, request_body, verbose=False):
+        self.verbose = verbose
+        connection = self._pool.get()
+        try:
+            # Retry once when the server dropped an idle keep-alive connection
+            for attempt in (0, 1):
+                if connection is None:
+                    connection = self._new_connection(host)
+                try:
+                    return self._send(connection, host, handler, request_body)
+                except xmlrpc.client.Fault:
+                    raise
+                except (http.client.RemoteDisconnected, ConnectionResetError,
+                        ConnectionAbortedError, BrokenPipeError):
+                    connection.close()
+                    connection = None
+                    if attempt:
+                        raise
+                except Exception:
+                    connection.close()
+                    connection = None
+                    raise
+        finally:
+            self._pool.put(connection)
+
+    def close(self):
+        connections = []
+        while True:
+            try:
+                connections.append(self._pool.get_nowait())
+            except queue.Empty:
+                break
+        for connection in connections:
+            if connection is not None:
+                connection.close()
+            self._pool.put(None)
+
+
+# === Clients ===
+class OdooClient:
+    """Protocol-independent Odoo client.
+
+    Backends implement ``_call(service, method, *args)`` for the ``common``
+    and ``object`` services. Every call goes through ``policy`` (a
+    CallPolicy) for rate limiting, adaptive concurrency and retries, and
+    fails with a timeout after ``timeout`` seconds without a response.
+    Instances are safe to share between threads.
+    """
+
+    def __init__(self, url, db, username, password, pool_size=8, policy=None, timeout=None):
+        self.url = url
+        self.db = db
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.policy = policy or CallPolicy(max_concurrency=pool_size)
+        self.timeout = timeout
+        self.uid = None
+
+    def _call(self, service, method, *args):
+        raise NotImplementedError
+
+    def login(self):
+        uid = self.policy.run(
+            lambda: self._call('common', 'authenticate', self.db, self.username, self.password, {}),
+            method='authenticate')
+        if not uid:
+            raise OdooError("Authentication failed")
+        self.uid = uid
+        return uid
+
+    def execute(self, model, method, *args, **kwargs):
+        with traced_call(model, method, args) as call:
+            result = self.policy.run(
+                lambda: self._call('object', 'execute_kw',
+                    self.db, self.uid, self.password, model, method, list(args), kwargs),
+                method=method, key=(model, method))
+            if call is not None:
+                call['results'] = result_count(result)
+        return result
+
+    def search(self, model, domain, **kwargs):
+        return self.execute(model, 'search', domain, **kwargs)
+
+    def search_read(self, model, domain, fields=None, **kwargs):
+        if fields is not None:
+            kwargs['fields'] = fields
+        return self.execute(model, 'search_read', domain, **kwargs)
+
+    def read(self, model, ids, fields=None):
+        kwargs = {'fields': fields} if fields is not None else {}
+        return self.execute(model, 'read', ids, **kwargs)
+
+    def create(self, model, vals):
+        return self.execute(model, 'create', vals)
+
+
+class XmlRpcClient(OdooClient):
+    """Client speaking XML-RPC on /xmlrpc/2 over pooled keep-alive connections"""
+
+    def __init__(self, url, db, username, password, pool_size=8, policy=None, timeout=None):
+        super().__init__(url, db, username, password, pool_size, policy, timeout)
+        self._proxies = {
+            service: xmlrpc.client.ServerProxy(
+                url + 'xmlrpc/2/' + service,
+                transport=PooledTransport(pool_size, use_https=url.startswith('https'), timeout=timeout))
+            for service in ('common', 'object')
+        }
+
+    def _call(self, service, method, *args):
+        try:
+            return getattr(self._proxies[service], method)(*args)
+        except xmlrpc.client.Fault as e:
+            raise OdooError(e.faultString) from e
+
+
+class JsonRpcClient(OdooClient):
+    """Client speaking JSON-RPC on /jsonrpc over a pooled requests session"""
+
+    def __init__(self, url, db, username, password, pool_size=8, policy=None, timeout=None):
+        super().__init__(url, db, username, password, pool_size, policy, timeout)
+        self._session = requests.Session()
+        self._session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True))
+        self._ids = itertools.count(1)
+
+    def _call(self, service, method, *args):
+        payload = {
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'params': {'service': service, 'method': method, 'args': args},
+            'id': next(self._ids),
+        }
+        response = self._session.post(self.url + 'jsonrpc', json=payload, timeout=self.timeout)
+        note_bytes(len(response.request.body or b''), len(response.content))
+        response.raise_for_status()
+        body = response.json()
+        if body.get('error'):
+            error = body['error']
+            raise OdooError((error.get('data') or {}).get('message') or error.get('message'))
+        return body['result']
+
+
+CLIENT_CLASSES = {
+    'xmlrpc': XmlRpcClient,
+    'jsonrpc': JsonRpcClient,
+}
+
+def create_client(protocol, url, db, username, password, pool_size=8, policy=None, timeout=None):
+    """Build and authenticate a client for the given protocol ('xmlrpc' or 'jsonrpc')"""
+    try:
+        client_class = CLIENT_CLASSES[protocol]
+    except KeyError:
+        raise ValueError(f"Unknown Odoo RPC protocol: {protocol}")
+    client = client_class(url, db, username, password, pool_size, policy, timeout)
+    client.login()
+    return client
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+
+from sqlite_mirror import SQLiteMirror, chunks, many2one, split_many2one
+
+logger = logging.getLogger(__name__)
+
+PO_LINE_FIELDS = ['order_id', 'product_template_id', 'price_unit', 'discount', 'write_date']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS po_lines (
+    id INTEGER PRIMARY KEY,
+    order_id INTEGER,
+    order_name TEXT,
+    product_template_id INTEGER,
+    product_template_name TEXT,
+    price_unit REAL,
+    discount REAL,
+    write_date TEXT
+);
+CREATE INDEX IF NOT EXISTS po_lines_order ON po_lines (order_id);
+"""
+
+# The price cache keeps a single sync watermark
+SYNC_SCOPE = 0
+
+
+def _row(line):
+    return (line['id'], *split_many2one(line, 'order_id'), *split_many2one(line, 'product_template_id'),
+            line['price_unit'], line['discount'], line.get('write_date'))
+
+
+class PriceCache(SQLiteMirror):
+    """SQLite cache of purchase order line prices keyed by PO line ID.
+
+    Cached lines are trusted for ``sync_interval`` seconds. After that the
+    next lookup runs one refresh: POs written since the watermark are
+    invalidated as a whole, and lines written since the watermark are
+    re-read. The watermark starts at the newest write_date of the first
+    lines stored and only a refresh advances it, to the newest write_date
+    its own queries returned. A write made after a line was cached is newer
+    than that, so the following refresh picks it up.
+    ``on_invalidate(order_ids)`` lets other PO caches drop the same orders:
+    the modified POs and the POs of the re-read lines.
+    """
+
+    def __init__(self, path=':memory:', sync_interval=60, on_invalidate=None):
+        super().__init__(path, SCHEMA)
+        self.sync_interval = sync_interval
+        self.on_invalidate = on_invalidate
+        self._refresh_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'invalidated_orders': 0}
+
+    def store(self, lines):
+        """Cache lines read from Odoo (must include ``write_date``), starting the watermark if there is none.
+
+        Storing never moves an existing watermark: lines read since the last
+        refresh say nothing about writes to the other cached lines.
+        """
+        lines = [line for line in lines if line.get('write_date')]
+        if not lines:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO po_lines VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [_row(line) for line in lines])
+            newest = max(line['write_date'] for line in lines)
+            self._conn.execute("INSERT OR IGNORE INTO sync_state VALUES (?, ?, ?)", (SYNC_SCOPE, newest, time.time()))
+
+    def invalidate_orders(self, order_ids, notify=True):
+        """Drop all cached lines of the given purchase orders"""
+        order_ids = list(set(order_ids))
+        if not order_ids:
+            return
+        with self._lock, self._conn:
+            for chunk in chunks(order_ids):
+                self._conn.execute(
+                    f"DELETE FROM po_lines WHERE order_id IN ({','.join('?' * len(chunk))})", chunk)
+            self._stats['invalidated_orders'] += len(order_ids)
+        if notify and self.on_invalidate:
+            self.on_invalidate(order_ids)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM po_lines")
+            self._conn.execute("DELETE FROM sync_state")
+
+    def refresh(self, client, force=False):
+        """Invalidate modified POs and re-read modified lines, at most once per ``sync_interval``"""
+        with self._refresh_lock:
+            state = self._sync_state(SYNC_SCOPE)
+            if not state or (not force and time.time() - state[1] < self.sync_interval):
+                return
+            watermark = state[0]
+            with self._lock:
+                order_ids = [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT order_id FROM po_lines WHERE order_id IS NOT NULL")]
+
+            if order_ids:
+                changed_orders = client.search_read('purchase.order',
+                    [['id', 'in', order_ids], ['write_date', '>=', watermark]],
+                    ['write_date'])
+                self.invalidate_orders([order['id'] for order in changed_orders])
+
+                changed_lines = client.search_read('purchase.order.line',
+                    [['order_id', 'in', order_ids], ['write_date', '>=', watermark]],
+                    PO_LINE_FIELDS)
+                self.store(changed_lines)
+                # Lines can change without their PO's write_date moving, so other caches drop those orders too
+                line_order_ids = set(line['order_id'][0] for line in changed_lines if line['order_id'])
+                line_order_ids.difference_update(order['id'] for order in changed_orders)
+                if line_order_ids and self.on_invalidate:
+                    self.on_invalidate(list(line_order_ids))
+
+                newest = max([watermark] + [record['write_date'] for record in changed_orders + changed_lines])
+                logger.info("Price cache refreshed: %d POs invalidated, %d lines updated",
+                            len(changed_orders), len(changed_lines))
+            else:
+                newest = watermark
+            self._set_sync_state(SYNC_SCOPE, newest, time.time())
+
+    def get_lines(self, client, line_ids):
+        """Return ``{line_id: line}`` shaped like ``read`` results, fetching only unknown lines"""
+        line_ids = list(set(line_ids))
+        if not line_ids:
+            return {}
+        self.refresh(client)
+
+        lines = {}
+        with self._lock:
+            for chunk in chunks(line_ids):
+                rows = self._conn.execute(
+                    "SELECT id, order_id, order_name, product_template_id, product_template_name, "
+                    f"price_unit, discount, write_date FROM po_lines WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                for row in rows:
+                    lines[row[0]] = {
+                        'id': row[0],
+                        'order_id': many2one(row[1], row[2]),
+                        'product_template_id': many2one(row[3], row[4]),
+                        'price_unit': row[5],
+                        'discount': row[6],
+                        'write_date': row[7],
+                    }
+
+        missing_ids = [line_id for line_id in line_ids if line_id not in lines]
+        with self._lock:
+            self._stats['hits'] += len(lines)
+            self._stats['misses'] += len(missing_ids)
+        if missing_ids:
+            fetched = client.read('purchase.order.line', missing_ids, PO_LINE_FIELDS)
+            self.store(fetched)
+            lines.update((line['id'], line) for line in fetched)
+        return lines
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM po_lines").fetchone()[0]
+            return dict(self._stats, size=size)
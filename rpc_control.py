@@ -0,0 +1,201 @@
+"""Retry, rate limiting and adaptive concurrency for Odoo RPC calls."""
+import http.client
+import logging
+import random
+import re
+import threading
+import time
+import xmlrpc.client
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+RETRY_HTTP_STATUSES = {429, 502, 503, 504}
+# Statuses returned before Odoo ran the call, so even writes are safe to resend
+REJECTED_HTTP_STATUSES = {429, 503}
+
+# Faults raised when PostgreSQL rolled the transaction back; Odoo itself retries these
+SERIALIZATION_FAULT = re.compile(
+    r'SerializationFailure|could not serialize access|deadlock detected|TransactionRollbackError'
+    r'|LockNotAvailable|could not obtain lock', re.IGNORECASE)
+
+# Methods that must not be resent when the server may already have run them
+NON_IDEMPOTENT_METHODS = {'create', 'write', 'unlink', 'copy', 'action_post', 'button_confirm'}
+
+
+def _http_status(error):
+    if isinstance(error, xmlrpc.client.ProtocolError):
+        return error.errcode
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    return None
+
+def _retry_after(error):
+    if isinstance(error, xmlrpc.client.ProtocolError):
+        headers = error.headers or {}
+    elif isinstance(error, requests.HTTPError) and error.response is not None:
+        headers = error.response.headers
+    else:
+        return None
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def classify_error(error):
+    """Return 'safe' (retry any call), 'idempotent' (retry reads only) or None (do not retry)"""
+    status = _http_status(error)
+    if status is not None:
+        if status in REJECTED_HTTP_STATUSES:
+            return 'safe'
+        return 'idempotent' if status in RETRY_HTTP_STATUSES else None
+    if isinstance(error, (ConnectionRefusedError, requests.exceptions.ConnectTimeout)):
+        return 'safe'
+    if isinstance(error, (ConnectionError, TimeoutError, http.client.HTTPException,
+                          requests.ConnectionError, requests.Timeout)):
+        return 'idempotent'
+    # Odoo faults: only transaction conflicts are transient, validation errors never are
+    if SERIALIZATION_FAULT.search(str(error)):
+        return 'safe'
+    return None
+
+def is_overload(error):
+    """Whether an error means the server is shedding load"""
+    return _http_status(error) in RETRY_HTTP_STATUSES or isinstance(error, TimeoutError)
+
+
+class TokenBucket:
+    """Blocking token bucket allowing ``rate`` calls per second with bursts of ``burst``"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """AIMD limit on in-flight calls.
+
+    The limit grows by one for every ``limit`` successful calls and is
+    halved (at most once per ``cooldown`` seconds) when a call is rejected
+    for overload or its latency exceeds ``latency_tolerance`` times the
+    baseline, the lowest recent smoothed latency. Latencies are tracked per
+    ``key`` (e.g. model and method) since a large search_read is always
+    slower than a small read.
+    """
+
+    def __init__(self, max_limit, min_limit=1, latency_tolerance=2.0, cooldown=1.0):
+        self.max_limit = max(max_limit, min_limit)
+        self.min_limit = min_limit
+        self.latency_tolerance = latency_tolerance
+        self.cooldown = cooldown
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._latencies = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, overloaded=False, key=None):
+        with self._condition:
+            self.in_flight -= 1
+            if latency is not None:
+                smoothed, baseline = self._latencies.get(key, (latency, latency))
+                smoothed = 0.8 * smoothed + 0.2 * latency
+                # Let the baseline drift up slowly so a permanently slower server is not punished forever
+                baseline = min(baseline * 1.01, smoothed)
+                self._latencies[key] = (smoothed, baseline)
+                overloaded = overloaded or smoothed > baseline * self.latency_tolerance
+
+            now = time.monotonic()
+            if overloaded:
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    logger.info("Odoo concurrency limit lowered to %d", int(self.limit))
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class CallPolicy:
+    """Runs RPC calls through the rate limiter, the adaptive limiter and classified retries.
+
+    Retries use exponential backoff with full jitter, or the server's
+    Retry-After when it sends one. Calls that may have been applied
+    (timeouts, 502/504) are only resent for idempotent methods.
+    """
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0,
+                 rate_limit=0, burst=None, max_concurrency=8):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bucket = TokenBucket(rate_limit, burst)
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self._stats = {'calls': 0, 'retries': 0, 'failures': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def backoff(self, attempt, error=None):
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def run(self, func, method=None, key=None):
+        """Call ``func()``; ``method`` decides whether ambiguous failures may be resent"""
+        idempotent = method not in NON_IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            self.limiter.acquire()
+            self._count('calls')
+            started = time.monotonic()
+            try:
+                result = func()
+            except Exception as e:
+                self.limiter.release(overloaded=is_overload(e))
+                kind = classify_error(e)
+                retryable = kind == 'safe' or (kind == 'idempotent' and idempotent)
+                if not retryable or attempt >= self.max_retries:
+                    self._count('failures')
+                    raise
+                delay = self.backoff(attempt, e)
+                logger.warning("Retrying Odoo call %s in %.1fs after %s: %s",
+                               method, delay, type(e).__name__, e)
+                self._count('retries')
+                attempt += 1
+                time.sleep(delay)
+            else:
+                self.limiter.release(latency=time.monotonic() - started, key=key or method)
+                return result
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, concurrency_limit=int(self.limiter.limit))
@@ -0,0 +1,189 @@
+"""Per-operation tracing of Odoo RPC calls.
+
+Wrap an operation in ``trace_operation(name)`` and every ``execute`` made
+inside it, including from worker threads started with ``submit_traced``,
+is recorded with its model, method, argument size, payload bytes, latency
+and result count. Finished traces are kept in a bounded process-wide list
+for the diagnostics panel.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# Calls of one model/method with the same domain shape above this count,
+# each touching at most N_PLUS_ONE_MAX_SIZE values, are flagged as a
+# probable N+1 pattern
+N_PLUS_ONE_MIN_CALLS = 5
+N_PLUS_ONE_MAX_SIZE = 5
+
+SEARCH_METHODS = ('search', 'search_read', 'search_count', 'read_group')
+
+_active_traces = contextvars.ContextVar('active_traces', default=())
+_current_call = contextvars.ContextVar('current_call', default=None)
+_recent_traces = deque(maxlen=20)
+_recent_lock = threading.Lock()
+
+
+def _is_leaf(leaf):
+    return isinstance(leaf, (list, tuple)) and len(leaf) == 3
+
+def argument_size(method, args):
+    """Number of values a call works on: list operands for searches, IDs for reads, records for creates.
+
+    Scalar domain operands (``name ilike x``, ``company_id = False``) filter
+    a search rather than batch it, so they do not count.
+    """
+    if not args:
+        return 0
+    first = args[0]
+    if method in SEARCH_METHODS:
+        return sum(len(leaf[2]) for leaf in first if _is_leaf(leaf) and isinstance(leaf[2], (list, tuple)))
+    if isinstance(first, (list, tuple)):
+        return len(first)
+    return 1
+
+def domain_shape(method, args):
+    """Fields and operators of a search domain without its operands, or () for other calls"""
+    if method not in SEARCH_METHODS or not args:
+        return ()
+    return tuple((leaf[0], leaf[1]) if _is_leaf(leaf) else leaf for leaf in args[0])
+
+def result_count(result):
+    return len(result) if isinstance(result, (list, tuple, dict)) else int(result is not None)
+
+def note_bytes(sent=0, received=0):
+    """Add transport payload sizes to the call in progress, if it is traced"""
+    call = _current_call.get()
+    if call is not None:
+        call['bytes_sent'] += sent
+        call['bytes_received'] += received
+
+
+class Trace:
+    """RPC calls recorded during one named operation"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.wall_time = None
+        self.calls = []
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self._started
+
+    def summary(self):
+        """Aggregate calls per model/method and flag probable N+1 patterns.
+
+        A pattern is one model/method called many times with the same domain
+        shape (same fields and operators, different operands) and few values
+        per call, such as one search per product or vendor.
+        """
+        with self._lock:
+            calls = list(self.calls)
+
+        operations = {}
+        shapes = {}
+        for call in calls:
+            shape = shapes.setdefault((call['model'], call['method'], call['shape']), {'calls': 0, 'arg_size': 0})
+            shape['calls'] += 1
+            shape['arg_size'] += call['arg_size']
+            op = operations.setdefault((call['model'], call['method']), {
+                'model': call['model'], 'method': call['method'], 'calls': 0, 'errors': 0,
+                'total_ms': 0.0, 'max_ms': 0.0, 'arg_size': 0, 'results': 0,
+                'bytes_sent': 0, 'bytes_received': 0,
+            })
+            op['calls'] += 1
+            op['errors'] += int(bool(call['error']))
+            op['total_ms'] += call['latency_ms']
+            op['max_ms'] = max(op['max_ms'], call['latency_ms'])
+            op['arg_size'] += call['arg_size']
+            op['results'] += call['results']
+            op['bytes_sent'] += call['bytes_sent']
+            op['bytes_received'] += call['bytes_received']
+
+        for op in operations.values():
+            op['avg_ms'] = op['total_ms'] / op['calls']
+
+        flags = []
+        for (model, method, domain), shape in shapes.items():
+            if shape['calls'] >= N_PLUS_ONE_MIN_CALLS and shape['arg_size'] / shape['calls'] <= N_PLUS_ONE_MAX_SIZE:
+                same_domain = " on the same domain shape" if domain else ""
+                flags.append(f"Possible N+1: {model}.{method} called {shape['calls']} times{same_domain} "
+                             f"with ~{shape['arg_size'] / shape['calls']:.1f} values each; batch these calls.")
+
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'wall_time_s': self.wall_time,
+            'rpc_calls': len(calls),
+            'rpc_time_ms': sum(call['latency_ms'] for call in calls),
+            'bytes_sent': sum(call['bytes_sent'] for call in calls),
+            'bytes_received': sum(call['bytes_received'] for call in calls),
+            'operations': sorted(operations.values(), key=lambda op: -op['total_ms']),
+            'flags': flags,
+            'calls': calls,
+        }
+
+
+@contextmanager
+def trace_operation(name):
+    """Record the RPC calls made inside the block; nested traces also record into their parents"""
+    trace = Trace(name)
+    token = _active_traces.set(_active_traces.get() + (trace,))
+    try:
+        yield trace
+    finally:
+        _active_traces.reset(token)
+        trace.finish()
+        with _recent_lock:
+            _recent_traces.appendleft(trace)
+
+def recent_traces():
+    with _recent_lock:
+        return list(_recent_traces)
+
+@contextmanager
+def traced_call(model, method, args):
+    """Time one RPC call for the active traces; a no-op when nothing is being traced"""
+    traces = _active_traces.get()
+    if not traces:
+        yield
+        return
+
+    call = {
+        'model': model,
+        'method': method,
+        'arg_size': argument_size(method, args),
+        'shape': domain_shape(method, args),
+        'results': 0,
+        'bytes_sent': 0,
+        'bytes_received': 0,
+        'latency_ms': 0.0,
+        'error': None,
+        'thread': threading.current_thread().name,
+    }
+    token = _current_call.set(call)
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        call['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        call['latency_ms'] = (time.perf_counter() - started) * 1000
+        _current_call.reset(token)
+        for trace in traces:
+            trace.add(call)
+
+def submit_traced(executor, fn, *args, **kwargs):
+    """``executor.submit`` that carries the active traces into the worker thread"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,56 @@
+"""Shared plumbing of the local SQLite mirrors of Odoo records (lot index, price cache)."""
+import sqlite3
+import threading
+
+# SQLite's default limit on host parameters per statement is 999
+QUERY_CHUNK_SIZE = 900
+
+# Incremental sync position of each scope (a company for the lot index, a single row for the price cache)
+SYNC_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    scope INTEGER PRIMARY KEY,
+    watermark TEXT,
+    synced_at REAL
+);
+"""
+
+
+def chunks(values):
+    values = list(values)
+    for i in range(0, len(values), QUERY_CHUNK_SIZE):
+        yield values[i:i + QUERY_CHUNK_SIZE]
+
+def many2one(record_id, name):
+    return [record_id, name] if record_id else False
+
+def split_many2one(record, field):
+    """``(id, name)`` of a many2one value read from Odoo, or ``(None, None)`` when it is empty"""
+    value = record.get(field)
+    return (value[0], value[1]) if value else (None, None)
+
+
+class SQLiteMirror:
+    """SQLite database of Odoo records with a sync watermark per scope.
+
+    One connection is shared between threads and guarded by ``_lock``.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(schema + SYNC_STATE_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _sync_state(self, scope):
+        """``(watermark, synced_at)`` of a scope, or None before its first sync"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT watermark, synced_at FROM sync_state WHERE scope = ?", (scope,)).fetchone()
+
+    def _set_sync_state(self, scope, watermark, synced_at):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)", (scope, watermark, synced_at))